@@ -1,19 +1,126 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Response, g, jsonify, render_template, stream_template, stream_with_context, request, redirect, url_for, flash
 import sqlite3
-from ultralytics import YOLO
 import cv2
 import numpy as np
 import base64
-import datetime
+import binascii
+import contextlib
+import csv
+import functools
+import io
+import multiprocessing
+import time
+from inference import InferenceScheduler, FrameSuperseded, ModelLoader
+from backends import Detections, build_model, deduplicate
+from worker import WorkerModel
+from framering import FrameRing, RingFull
+from motion import MotionGate, MOTION_GATE_ENABLED, merge_roi
+from tracker import TrackerRegistry
+from db import get_db, release
+from migrations import migrate
+from holdings import log_actions, held_quantities
+from paging import LogPage
+from inventory_cache import InventoryCache
+from jobs import JobStore
+from metrics import Registry, RequestTimer, SERVER_TIMING
+import bulk
+import search
+import sqlprofile
 
-# Load YOLO model once - use relative path
-model_path = os.path.join(os.path.dirname(__file__), "capstone.pt")
-model = YOLO(model_path)
+# Load YOLO model once, in the background - use relative path. LABCV_BACKEND
+# picks the runtime (ultralytics, onnx or openvino); LABCV_MODEL points at
+# other weights. Pages that don't detect anything work while it loads.
+model_path = os.environ.get('LABCV_MODEL') or os.path.join(os.path.dirname(__file__), "capstone.pt")
+
+# LABCV_SERVER=waitress serves the app with the multi-threaded waitress server
+# instead of the Werkzeug development server. LABCV_INFERENCE_WORKER runs the
+# model in its own process (on by default with waitress), so detection never
+# holds up the other pages and gets its own cores.
+SERVER = os.environ.get('LABCV_SERVER', 'dev').lower()
+SERVER_THREADS = int(os.environ.get('LABCV_SERVER_THREADS', '8'))
+INFERENCE_WORKER = os.environ.get('LABCV_INFERENCE_WORKER', '1' if SERVER == 'waitress' else '0').lower() in ('1', 'true', 'yes')
+
+# In-process until start_inference() says otherwise, so importing app (tests,
+# manage.py, the spawned worker re-running this file) starts nothing
+frame_ring = None
+model_loader = ModelLoader(lambda: build_model(model_path))
+
+def start_inference():
+    """Start loading the model; called by the server entry point only.
+
+    With the worker process on, this is where the shared frame ring is
+    allocated, so no other process that imports app maps one.
+    """
+    global frame_ring, model_loader
+    if INFERENCE_WORKER and frame_ring is None:
+        # Decoded frames reach the worker through shared memory slots instead of the pipe
+        frame_ring = FrameRing()
+        ring = frame_ring
+        model_loader = ModelLoader(lambda: WorkerModel(functools.partial(build_model, model_path), ring=ring))
+    model_loader.start()
+
+# Frames from concurrent detection clients are micro-batched into one model call
+inference_scheduler = InferenceScheduler(lambda frames: model_loader.model(frames))
+
+# Skips the model for frames that barely changed since the session's last processed one
+motion_gate = MotionGate()
+
+# Stabilizes detections across frames of a session (stable IDs, N-of-M confirmation)
+trackers = TrackerRegistry()
+inventory_cache = InventoryCache()
+
+# Captures from the borrow page run in the background; results are polled by job ID
+capture_jobs = JobStore()
+
+# Per-endpoint and per-stage latencies, served on /metrics
+request_metrics = Registry()
 
 app = Flask(__name__)
 app.secret_key = 'secret'
 
+@app.before_request
+def start_request_timer():
+    g.timer = RequestTimer()
+    if sqlprofile.ENABLED:
+        sqlprofile.profiler.take_thread_seconds()
+
+@app.after_request
+def record_request_metrics(response):
+    timer = g.get('timer')
+    if timer is None:
+        return response
+    endpoint, method = request.endpoint or 'unmatched', request.method
+
+    def finish():
+        if sqlprofile.ENABLED:
+            # Time spent in SQLite during this request, from the query profiler
+            sqlprofile.flush()
+            timer.add('db', sqlprofile.profiler.take_thread_seconds())
+        total = timer.elapsed()
+        request_metrics.observe_request(endpoint, method, response.status_code, total, timer.stages)
+        return total
+
+    if response.is_streamed:
+        # Streamed pages (stream_template) render and fetch their rows after this hook;
+        # record them once the body has been sent. Their Server-Timing only covers the view.
+        response.call_on_close(finish)
+        total = timer.elapsed()
+    else:
+        total = finish()
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = timer.server_timing(total)
+    return response
+
+def stage(name):
+    """Time a stage of the current request for /metrics and the Server-Timing header."""
+    return g.timer.stage(name)
+
+@app.teardown_request
+def release_db(exc):
+    # Connections are reused per thread; never leave a transaction open on one
+    release()
+
 # Map YOLO class names to actual inventory names
 CLASS_TO_EQUIPMENT = {
     "graduated_cylinder": "Graduated Cylinder",
@@ -28,101 +135,129 @@ CLASS_TO_EQUIPMENT = {
     'tripod': 'Tripod',
 }
 
+# Instance counting: boxes below this confidence are ignored, and boxes of the
+# same class overlapping more than COUNT_DEDUP_IOU are counted once
+COUNT_CONF_THRESHOLD = float(os.environ.get('LABCV_COUNT_CONF', '0.4'))
+COUNT_DEDUP_IOU = float(os.environ.get('LABCV_COUNT_DEDUP_IOU', '0.5'))
+
 # ---------- DB Setup ----------
 def init_db():
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
-
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS students (
-            student_id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            course TEXT,
-            year_level INTEGER,
-            student_type TEXT DEFAULT 'college'
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS equipment_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id TEXT NOT NULL,
-            equipment_name TEXT NOT NULL,
-            action TEXT CHECK(action IN ('borrow', 'return')),
-            quantity INTEGER DEFAULT 1,
-            timestamp TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS inventory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            total_quantity INTEGER DEFAULT 0,
-            quantity INTEGER DEFAULT 0
-        )
-    ''')
-    
-    # Add quantity column if it doesn't exist
-    try:
-        c.execute("ALTER TABLE equipment_log ADD COLUMN quantity INTEGER DEFAULT 1")
-    except:
-        pass
-    
-    # Add student_type column if it doesn't exist
-    try:
-        c.execute("ALTER TABLE students ADD COLUMN student_type TEXT DEFAULT 'college'")
-    except:
-        pass
-    
-    # Add total_quantity column if it doesn't exist (migrate existing data)
-    try:
-        c.execute("ALTER TABLE inventory ADD COLUMN total_quantity INTEGER DEFAULT 0")
-        # For existing items, set total_quantity equal to current quantity
-        c.execute("UPDATE inventory SET total_quantity = quantity WHERE total_quantity = 0")
-    except:
-        pass
-    
-    conn.commit()
-    conn.close()
+    """Create or upgrade the database schema (see migrations.py)."""
+    for name in migrate():
+        print(f"Applied migration: {name}")
 
 # ---------- Helper Functions ----------
 def get_inventory():
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
-    c.execute("SELECT id, name, total_quantity, quantity FROM inventory ORDER BY name ASC")
-    items = c.fetchall()
-    conn.close()
-    return items
+    """Return the (cached) inventory rows: id, name, total_quantity, quantity."""
+    return inventory_cache.rows()
 
 def get_inventory_dict():
-    """Return dict: equipment_name -> available quantity"""
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
-    c.execute("SELECT name, quantity FROM inventory")
-    items = c.fetchall()
-    conn.close()
-    return {name: qty for name, qty in items}
+    """Return dict: equipment_name -> available quantity (cached, don't modify)"""
+    return inventory_cache.by_name()
 
 def get_pending_equipment(student_id):
     """Return list of equipment student borrowed but hasn't fully returned."""
-    conn = sqlite3.connect("database.db")
+    conn = get_db()
     c = conn.cursor()
     c.execute("""
-        SELECT equipment_name, SUM(CASE WHEN action='borrow' THEN quantity ELSE -quantity END) as pending
-        FROM equipment_log
-        WHERE student_id=?
-        GROUP BY equipment_name
-        HAVING pending > 0
+        SELECT equipment_name, qty
+        FROM holdings
+        WHERE student_id=? AND qty > 0
         ORDER BY equipment_name ASC
     """, (student_id,))
     pending = c.fetchall()
-    conn.close()
     return pending
 
+# Content types accepted as a raw binary frame body on /process_frame
+BINARY_FRAME_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'application/octet-stream')
+
+def read_frame_bytes():
+    """Return the encoded image bytes of the current request, or None if there are none.
+
+    Accepts, in order: a raw binary body (``Content-Type: image/jpeg``), a
+    multipart upload in the ``frame`` field, or the legacy base64 data URL in
+    the ``image_data`` form field.
+    """
+    if request.mimetype in BINARY_FRAME_TYPES:
+        return request.get_data(cache=False) or None
+
+    upload = request.files.get('frame')
+    if upload:
+        return upload.read() or None
+
+    image_data = request.form.get('image_data', '')
+    if not image_data:
+        return None
+    if ',' in image_data:
+        image_data = image_data.split(",", 1)[1]
+    return base64.b64decode(image_data)
+
+def decode_frame(data):
+    """Decode encoded image bytes straight from the buffer into a BGR frame (None on failure)."""
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+def decoded_frame(data):
+    """Context manager giving the decoded frame, held in a shared memory slot when there is a frame ring."""
+    if frame_ring is not None:
+        return frame_ring.decode(data)
+    return contextlib.nullcontext(decode_frame(data))
+
+def count_equipment(result, names, inventory_dict):
+    """Return {equipment_name: instance count} for detections of items in the inventory."""
+    confident = result.conf >= COUNT_CONF_THRESHOLD
+    kept = deduplicate(Detections(result.xyxy[confident], result.conf[confident], result.cls[confident]),
+                       COUNT_DEDUP_IOU)
+    counts = {}
+    for cls_id in kept.cls.tolist():
+        equipment_name = CLASS_TO_EQUIPMENT.get(names[cls_id])
+        if equipment_name and equipment_name in inventory_dict:
+            counts[equipment_name] = counts.get(equipment_name, 0) + 1
+    return counts
+
+def parse_detected(values):
+    """Parse detected= query values into an ordered {equipment_name: quantity}.
+
+    Accepts 'Beaker:3,Funnel:1', plain 'Beaker,Funnel' (quantity 1) and
+    repeated detected= parameters.
+    """
+    detected = {}
+    for value in values:
+        for entry in value.split(','):
+            name, _, qty = entry.strip().rpartition(':')
+            if not name or not qty.isdigit():
+                name, qty = entry.strip(), '1'
+            if name:
+                detected[name] = max(int(qty), 1)
+    return detected
+
+def model_warming_up():
+    """Kick off model loading if needed; return True while the model isn't ready."""
+    model_loader.start()
+    return not model_loader.ready
+
 # ---------- Routes ----------
 @app.route('/')
 def home():
     return render_template('index.html')
 
+@app.route('/health')
+def health():
+    """Report server and detection model readiness."""
+    model_loader.start()
+    return {
+        'status': 'ok',
+        'model': model_loader.status(),
+        'inference': 'worker' if INFERENCE_WORKER else 'in-process',
+        'model_ready': model_loader.ready,
+        'model_error': model_loader.error,
+        'model_load_seconds': model_loader.load_seconds,
+    }
+
+@app.route('/metrics')
+def metrics():
+    """Request counts, error counts and latency quantiles in the Prometheus text format."""
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
@@ -132,100 +267,171 @@ def register():
         year = request.form['year_level']
         student_type = request.form.get('student_type', 'college')
         try:
-            if year:
-                year = int(year)
-                
-                # Validate year level based on student type
-                if student_type == 'ibed':
-                    if year < 1 or year > 12:
-                        flash("IBED student grade level must be between 1 and 12.")
-                        return redirect(url_for('register'))
-                elif student_type == 'college':
-                    if year < 1:
-                        flash("College student year level must be at least 1.")
-                        return redirect(url_for('register'))
-            else:
-                year = None
-        except ValueError:
-            flash("Year level must be a valid number.")
+            # Same rules as bulk imports
+            year = bulk.validate_year_level(year, student_type)
+        except ValueError as e:
+            flash(str(e))
             return redirect(url_for('register'))
         
 
-        conn = sqlite3.connect("database.db")
+        conn = get_db()
         c = conn.cursor()
         c.execute("INSERT OR IGNORE INTO students VALUES (?, ?, ?, ?, ?)", (sid, name, course, year, student_type))
         conn.commit()
-        conn.close()
         flash("Student registered successfully!")
         return redirect(url_for('register'))
 
     return render_template('register.html')
 
+@app.route('/admin_import', methods=['GET', 'POST'])
+def admin_import():
+    """Bulk-import students or inventory from an uploaded CSV/JSONL file; links to exports."""
+    result = None
+    if request.method == 'POST':
+        kind = request.form.get('kind', '')
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash("Please choose a file to import.")
+            return redirect(url_for('admin_import'))
+        if kind not in bulk.IMPORTS:
+            flash("Please choose what to import.")
+            return redirect(url_for('admin_import'))
+
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        try:
+            result = bulk.import_rows(kind, bulk.read_rows(stream, bulk.guess_format(upload.filename)))
+        except (UnicodeDecodeError, csv.Error) as e:
+            flash(f"Could not read the file: {e}")
+            return redirect(url_for('admin_import'))
+        if kind == 'inventory':
+            inventory_cache.invalidate()
+
+    return render_template('admin_import.html', result=result)
+
+@app.route('/admin_export/<kind>')
+def admin_export(kind):
+    """Stream a table as a CSV or JSONL download."""
+    fmt = request.args.get('format', 'csv')
+    if kind not in bulk.EXPORTS or fmt not in bulk.FORMATS:
+        flash("Unknown export.")
+        return redirect(url_for('admin_import'))
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(bulk.export_rows(kind, fmt)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'})
+
+# Students per page on /pending_equipment, and the orderings it offers
+PENDING_PAGE_SIZE = 50
+PENDING_SORTS = {
+    'student_id': "{t}.student_id ASC",
+    'total_desc': "{t}.total_pending DESC, {t}.student_id ASC",
+    'total_asc': "{t}.total_pending ASC, {t}.student_id ASC",
+}
+
+def get_pending_page(student_id=None, sort='student_id', page=1, per_page=PENDING_PAGE_SIZE):
+    """Return (students, total_students) with pending equipment, one page at a time.
+
+    A single grouped query over holdings picks the page of students and joins
+    their pending items; each entry has the same keys the template expects.
+    """
+    order = PENDING_SORTS.get(sort, PENDING_SORTS['student_id'])
+    where = "WHERE t.student_id = ?" if student_id else ""
+    params = ([student_id] if student_id else []) + [per_page, (page - 1) * per_page]
+
+    c = get_db().cursor()
+    c.execute(f"""
+        WITH totals AS (
+            SELECT student_id, SUM(qty) AS total_pending
+            FROM holdings
+            WHERE qty > 0
+            GROUP BY student_id
+        ), p AS (
+            SELECT t.student_id, s.name, s.course, s.year_level, t.total_pending,
+                   COUNT(*) OVER () AS matching
+            FROM totals t
+            JOIN students s ON s.student_id = t.student_id
+            {where}
+            ORDER BY {order.format(t='t')}
+            LIMIT ? OFFSET ?
+        )
+        SELECT p.student_id, p.name, p.course, p.year_level, p.total_pending, p.matching,
+               h.equipment_name, h.qty
+        FROM p
+        JOIN holdings h ON h.student_id = p.student_id AND h.qty > 0
+        ORDER BY {order.format(t='p')}, h.equipment_name ASC
+    """, params)
+
+    students, total = [], 0
+    for sid, name, course, year_level, total_pending, matching, equipment_name, qty in c.fetchall():
+        total = matching
+        if not students or students[-1]['student_id'] != sid:
+            students.append({
+                'student_id': sid,
+                'student_name': name,
+                'course': course,
+                'year_level': year_level,
+                'pending_items': [],
+                'total_pending': total_pending
+            })
+        students[-1]['pending_items'].append((equipment_name, qty))
+    return students, total
+
 @app.route('/pending_equipment', methods=['GET', 'POST'])
 def pending_equipment():
     """Display pending equipment for all students or a specific student."""
-    pending_data = []
     search_student_id = request.form.get('student_id', '').strip() if request.method == 'POST' else ''
-    
-    conn = sqlite3.connect("database.db")
+    sort = request.args.get('sort', 'student_id')
+    if sort not in PENDING_SORTS:
+        sort = 'student_id'
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        page = 1
+
+    conn = get_db()
     c = conn.cursor()
-    
+
     if search_student_id:
-        # Get pending equipment for specific student
-        c.execute("SELECT name, course, year_level FROM students WHERE student_id=?", (search_student_id,))
-        student = c.fetchone()
-        if student:
-            pending_items = get_pending_equipment(search_student_id)
-            if pending_items:
-                pending_data.append({
-                    'student_id': search_student_id,
-                    'student_name': student[0],
-                    'course': student[1],
-                    'year_level': student[2],
-                    'pending_items': pending_items,
-                    'total_pending': sum(qty for _, qty in pending_items)
-                })
+        student_id = search_student_id
+        c.execute("SELECT 1 FROM students WHERE student_id=?", (student_id,))
+        if not c.fetchone():
+            # Not an ID: look the text up as a name (or ID prefix) through the search index
+            matches = search.suggest(c, search_student_id, limit=2)
+            student_id = matches[0][0] if len(matches) == 1 else None
+            if matches and not student_id:
+                flash("More than one student matches; pick one from the suggestions.")
+            elif not matches:
+                flash("Student not found.")
+        if student_id:
+            search_student_id = student_id
+            pending_data, total_students = get_pending_page(student_id)
         else:
-            flash("Student not found.")
+            pending_data, total_students = [], 0
+        page = 1
     else:
-        # Get pending equipment for all students
-        c.execute("SELECT student_id FROM students ORDER BY student_id ASC")
-        students = c.fetchall()
-        
-        for (student_id,) in students:
-            pending_items = get_pending_equipment(student_id)
-            if pending_items:
-                c.execute("SELECT name, course, year_level FROM students WHERE student_id=?", (student_id,))
-                student = c.fetchone()
-                if student:
-                    pending_data.append({
-                        'student_id': student_id,
-                        'student_name': student[0],
-                        'course': student[1],
-                        'year_level': student[2],
-                        'pending_items': pending_items,
-                        'total_pending': sum(qty for _, qty in pending_items)
-                    })
-    
-    # Get all students for dropdown
-    c.execute("SELECT student_id, name FROM students ORDER BY student_id ASC")
-    all_students = c.fetchall()
-    conn.close()
-    
+        pending_data, total_students = get_pending_page(sort=sort, page=page, per_page=PENDING_PAGE_SIZE)
+        if not pending_data and page > 1:
+            # Past the end (e.g. items were returned since the link was made): go to the last page
+            c.execute("""
+                SELECT COUNT(*) FROM (SELECT student_id FROM holdings WHERE qty > 0 GROUP BY student_id) t
+                JOIN students s ON s.student_id = t.student_id
+            """)
+            last_page = max(1, -(-c.fetchone()[0] // PENDING_PAGE_SIZE))
+            return redirect(url_for('pending_equipment', sort=sort, page=last_page))
+
     return render_template('pending_equipment.html',
                          pending_data=pending_data,
-                         all_students=all_students,
-                         search_student_id=search_student_id)
+                         search_student_id=search_student_id,
+                         sort=sort,
+                         page=page,
+                         has_next=page * PENDING_PAGE_SIZE < total_students,
+                         total_students=total_students)
 
 @app.route('/borrow_return', methods=['GET', 'POST'])
 def borrow_return():
     inventory = get_inventory()
     inventory_dict = get_inventory_dict()
-    detected_items = request.args.get('detected')
-    if detected_items:
-        detected_items = detected_items.split(',')
-    else:
-        detected_items = []
+    detected_counts = parse_detected(request.args.getlist('detected'))
+    detected_items = list(detected_counts)
 
     # Get student_id from form or request (for displaying pending items)
     student_id = request.form.get('student_id', '').strip() or request.args.get('student_id', '').strip()
@@ -276,84 +482,68 @@ def borrow_return():
             flash("Invalid quantity entered.")
             return redirect(url_for('borrow_return'))
 
-        conn = sqlite3.connect("database.db")
+        # Total requested per item (the same item may be listed more than once)
+        requested = {}
+        for equipment_name, quantity in zip(equipment_names, quantities):
+            requested[equipment_name] = requested.get(equipment_name, 0) + quantity
+        marks = ', '.join('?' * len(requested))
+
+        conn = get_db()
         c = conn.cursor()
         
-        # Verify student exists
-        c.execute("SELECT student_id FROM students WHERE student_id=?", (student_id,))
-        student_row = c.fetchone()
-        if not student_row:
-            flash("Student not found. Please register first.")
-            conn.close()
-            return redirect(url_for('borrow_return'))
-        
-        # Verify all equipment exists
-        for equipment_name in equipment_names:
-            c.execute("SELECT quantity FROM inventory WHERE name=?", (equipment_name,))
+        # Process all equipment items in one transaction. BEGIN IMMEDIATE takes the
+        # write lock up front, so stock checked here can't be borrowed by another
+        # kiosk before we commit.
+        try:
+            c.execute("BEGIN IMMEDIATE")
+
+            # Verify student exists
+            c.execute("SELECT student_id FROM students WHERE student_id=?", (student_id,))
             if not c.fetchone():
-                flash(f"Equipment '{equipment_name}' not found in inventory.")
-                conn.close()
+                conn.rollback()
+                flash("Student not found. Please register first.")
                 return redirect(url_for('borrow_return'))
-        
-        # Process all equipment items in one transaction
-        success = True
-        try:
-            for equipment_name, quantity in zip(equipment_names, quantities):
-                # Check inventory exists and quantity available
-                c.execute("SELECT quantity FROM inventory WHERE name=?", (equipment_name,))
-                row = c.fetchone()
-                if not row:
+
+            # Verify all equipment exists, in one lookup
+            c.execute(f"SELECT name, quantity FROM inventory WHERE name IN ({marks})", list(requested))
+            stock = {name: qty or 0 for name, qty in c.fetchall()}
+            for equipment_name in requested:
+                if equipment_name not in stock:
+                    conn.rollback()
                     flash(f"Equipment '{equipment_name}' not found in inventory.")
-                    success = False
-                    break
-                inv_qty = row[0] or 0
-                
-                if action == 'borrow' and inv_qty < quantity:
-                    flash(f"Not enough '{equipment_name}' in inventory. Available: {inv_qty}")
-                    success = False
-                    break
-                
+                    return redirect(url_for('borrow_return'))
+
+            if action == 'borrow':
+                for equipment_name, quantity in requested.items():
+                    if stock[equipment_name] < quantity:
+                        conn.rollback()
+                        flash(f"Not enough '{equipment_name}' in inventory. Available: {stock[equipment_name]}")
+                        return redirect(url_for('borrow_return'))
+            else:
                 # Validate return quantity doesn't exceed what student borrowed
-                if action == 'return':
-                    c.execute(
-                        "SELECT COALESCE(SUM(CASE WHEN action='borrow' THEN quantity ELSE -quantity END), 0) FROM equipment_log WHERE student_id=? AND equipment_name=?",
-                        (student_id, equipment_name)
-                    )
-                    net_borrowed = c.fetchone()[0] or 0
+                held = held_quantities(c, student_id, requested)
+                for equipment_name, quantity in requested.items():
+                    net_borrowed = held.get(equipment_name, 0)
                     if quantity > net_borrowed:
+                        conn.rollback()
                         flash(f"Student cannot return {quantity} '{equipment_name}'. Only {net_borrowed} borrowed.")
-                        success = False
-                        break
+                        return redirect(url_for('borrow_return'))
 
-                # Update inventory counts
-                new_qty = inv_qty - quantity if action == 'borrow' else inv_qty + quantity
-                c.execute("UPDATE inventory SET quantity=? WHERE name=?", (new_qty, equipment_name))
+            # Update inventory counts
+            sign = -1 if action == 'borrow' else 1
+            c.executemany("UPDATE inventory SET quantity = COALESCE(quantity, 0) + ? WHERE name=?",
+                          [(sign * quantity, equipment_name) for equipment_name, quantity in requested.items()])
 
-                # Log the action with quantity
-                c.execute(
-                    "INSERT INTO equipment_log (student_id, equipment_name, action, quantity) VALUES (?, ?, ?, ?)",
-                    (student_id, equipment_name, action, quantity)
-                )
-
-            if not success:
-                conn.rollback()
-                conn.close()
-                return redirect(url_for('borrow_return'))
+            # Log the actions with quantities (and update the student's holdings)
+            transaction_id = log_actions(c, student_id, action, zip(equipment_names, quantities))
 
             conn.commit()
-            conn.close()
+            inventory_cache.invalidate()
             
-            # Redirect to summary page with transaction details
-            return redirect(url_for('transaction_summary', 
-                student_id=student_id,
-                action=action,
-                items=','.join(equipment_names),
-                quantities=','.join(map(str, quantities)),
-                total=sum(quantities)
-            ))
+            # Redirect to summary page for the transaction
+            return redirect(url_for('transaction_summary', transaction_id=transaction_id))
         except Exception as e:
             conn.rollback()
-            conn.close()
             flash(f"Error processing transaction: {e}")
             return redirect(url_for('borrow_return'))
 
@@ -361,8 +551,10 @@ def borrow_return():
                            inventory=inventory,
                            inventory_dict=inventory_dict,
                            detected_items=detected_items,
+                           detected_counts=detected_counts,
                            pending_equipment=pending_equipment,
-                           current_student_id=student_id)
+                           current_student_id=student_id,
+                           capture_job=request.args.get('job', ''))
 
 @app.route('/detect_equipment')
 def detect_equipment():
@@ -372,49 +564,75 @@ def detect_equipment():
 @app.route('/process_frame', methods=['POST'])
 def process_frame():
     """Process a video frame and detect equipment in real-time."""
+    if model_warming_up():
+        status = model_loader.status()
+        message = 'Detection model failed to load' if status == 'failed' else 'Model warming up'
+        return {'error': message, 'warming_up': status != 'failed', 'model': status}, 503, {'Retry-After': '1'}
+    model = model_loader.model
     try:
-        image_data = request.form.get('image_data', '')
-        if not image_data:
+        with stage('read'):
+            image_bytes = read_frame_bytes()
+        if not image_bytes:
             return {'error': 'No image data'}, 400
+
+        # With the inference worker the frame is decoded into a shared memory
+        # slot, which stays reserved until the model has run on it
+        with contextlib.ExitStack() as slot:
+            with stage('decode'):
+                frame = slot.enter_context(decoded_frame(image_bytes))
+            if frame is None:
+                return {'error': 'Failed to decode image'}, 400
         
-        # Decode image data
-        if ',' in image_data:
-            image_data = image_data.split(",")[1]
-        
-        nparr = np.frombuffer(base64.b64decode(image_data), np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if frame is None:
-            return {'error': 'Failed to decode image'}, 400
-        
-        # Run YOLO detection
-        results = model(frame, verbose=False)
-        
+            # Run YOLO detection (batched with frames from other clients). Only the
+            # newest queued frame of a detection session is run; older ones get a
+            # cheap "superseded" reply so boxes on screen stay close to real time.
+            session_id = request.headers.get('X-Detection-Session') or None
+            started = time.perf_counter()
+            cached, roi = None, None
+            if session_id and MOTION_GATE_ENABLED:
+                with stage('motion'):
+                    thumb, cached, roi = motion_gate.check(session_id, frame)
+
+            if cached is not None:
+                # Nothing moved: reuse the session's previous detections
+                result = cached
+            else:
+                x1, y1, x2, y2 = roi or (0, 0, frame.shape[1], frame.shape[0])
+                future = inference_scheduler.submit(frame[y1:y2, x1:x2] if roi else frame, session=session_id)
+                try:
+                    result = future.result()
+                except FrameSuperseded:
+                    return {'superseded': True}
+                for name, seconds in future.stages.items():
+                    g.timer.add(name, seconds)
+                if roi:
+                    result = merge_roi(motion_gate.previous(session_id), result, roi)
+                if session_id and MOTION_GATE_ENABLED:
+                    motion_gate.store(session_id, thumb, result, roi)
+            inference_ms = (time.perf_counter() - started) * 1000.0
+
+        with stage('inventory'):
+            inventory_dict = get_inventory_dict()
+
+        postprocess_started = time.perf_counter()
         detected_classes = set()
         boxes = []
-        inventory_dict = get_inventory_dict()
         
-        for r in results:
-            for box in r.boxes:
-                cls_id = int(box.cls[0])
-                class_name = model.names[cls_id]
-                detected_classes.add(class_name)
-                
-                # Get equipment name
-                equipment_name = CLASS_TO_EQUIPMENT.get(class_name)
-                if equipment_name and equipment_name in inventory_dict:
-                    # Extract box coordinates
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    confidence = float(box.conf[0])
-                    
-                    boxes.append({
-                        'x1': float(x1),
-                        'y1': float(y1),
-                        'x2': float(x2),
-                        'y2': float(y2),
-                        'label': equipment_name,
-                        'confidence': confidence
-                    })
+        for (x1, y1, x2, y2), confidence, cls_id in zip(result.xyxy.tolist(), result.conf.tolist(), result.cls.tolist()):
+            class_name = model.names[cls_id]
+            detected_classes.add(class_name)
+            
+            # Get equipment name
+            equipment_name = CLASS_TO_EQUIPMENT.get(class_name)
+            if equipment_name and equipment_name in inventory_dict:
+                boxes.append({
+                    'x1': x1,
+                    'y1': y1,
+                    'x2': x2,
+                    'y2': y2,
+                    'label': equipment_name,
+                    'confidence': confidence
+                })
         
         # Map detected classes to equipment names
         detected_equipment = []
@@ -424,45 +642,113 @@ def process_frame():
                 if equipment_name in inventory_dict:
                     detected_equipment.append(equipment_name)
         
-        return {
-            'detected_classes': detected_equipment,
-            'boxes': boxes,
-            'count': len(detected_equipment)
-        }
+        # Confirmed tracks: only items seen consistently across frames count
+        tracks = []
+        confirmed = {}
+        if session_id:
+            for track in trackers.update(session_id, result):
+                equipment_name = CLASS_TO_EQUIPMENT.get(model.names[track.cls])
+                if equipment_name and equipment_name in inventory_dict:
+                    x1, y1, x2, y2 = track.box
+                    tracks.append({
+                        'id': track.id,
+                        'x1': x1,
+                        'y1': y1,
+                        'x2': x2,
+                        'y2': y2,
+                        'label': equipment_name,
+                        'confidence': track.conf
+                    })
+                    confirmed[equipment_name] = confirmed.get(equipment_name, 0) + 1
+        counts = count_equipment(result, model.names, inventory_dict)
+        g.timer.add('postprocess', time.perf_counter() - postprocess_started)
+        
+        with stage('json'):
+            return jsonify({
+                'detected_classes': detected_equipment,
+                'boxes': boxes,
+                'tracks': tracks,
+                'confirmed': confirmed,
+                'counts': counts,
+                'count': len(detected_equipment),
+                'inference_ms': round(inference_ms, 1),
+                'cached': cached is not None
+            })
+    except RingFull:
+        # Every frame slot is in use: ask the client to back off instead of queueing more
+        return {'error': 'Server busy', 'busy': True}, 503, {'Retry-After': '1'}
     except Exception as e:
         print(f"Frame processing error: {str(e)}")
         return {'error': str(e), 'detected_classes': [], 'boxes': []}, 500
 
+@app.route('/inference_stats')
+def inference_stats():
+    """Return the inference scheduler's queue-depth and batch-size metrics."""
+    stats = inference_scheduler.stats()
+    stats['motion'] = motion_gate.stats()
+    if frame_ring is not None:
+        stats['frame_ring'] = frame_ring.stats()
+    stats['capture_jobs'] = capture_jobs.stats()
+    return stats
+
 @app.route('/process_capture', methods=['POST'])
 def process_capture():
-    image_data = request.form['image_data'].split(",")[1]
-    nparr = np.frombuffer(base64.b64decode(image_data), np.uint8)
-    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-    results = model(frame)
-    detected_classes = set()
-    for r in results:
-        for box in r.boxes:
-            cls_id = int(box.cls[0])
-            detected_classes.add(model.names[cls_id])
-
-    # Map class names to inventory names
-    detected_equipment = []
-    inventory_dict = get_inventory_dict()
-    for cls in detected_classes:
-        if cls in CLASS_TO_EQUIPMENT and CLASS_TO_EQUIPMENT[cls] in inventory_dict:
-            detected_equipment.append(CLASS_TO_EQUIPMENT[cls])
+    """Queue a captured frame for detection and answer with a job ID straight away.
 
-    if detected_equipment:
-        flash("Detected: " + ", ".join(detected_equipment))
-        return redirect(url_for("borrow_return", detected=",".join(detected_equipment)))
-    else:
-        flash("No valid equipment detected in inventory.")
+    Clients that accept JSON get 202 with the job's URL; a plain form post is
+    sent back to the borrow page, which polls the job and fills in the items.
+    """
+    wants_json = request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+    if model_warming_up():
+        if wants_json:
+            return {'error': 'Model warming up', 'warming_up': True}, 503, {'Retry-After': '1'}
+        flash("The detection model is still warming up. Please try again in a moment.")
+        return redirect(url_for("borrow_return"))
+    model = model_loader.model
+
+    # Decoded outside the frame ring: the job outlives this request and its slot
+    try:
+        with stage('read'):
+            image_bytes = read_frame_bytes()
+    except (ValueError, binascii.Error):
+        image_bytes = None  # malformed base64 in image_data
+    with stage('decode'):
+        frame = decode_frame(image_bytes) if image_bytes else None
+    if frame is None:
+        if wants_json:
+            return {'error': 'No image received from the camera'}, 400
+        flash("No image received from the camera.")
         return redirect(url_for("borrow_return"))
 
+    future = inference_scheduler.submit(frame)
+
+    def finish(result):
+        # The job's own stages are recorded when it finishes, after this request is long gone
+        for name, seconds in future.stages.items():
+            request_metrics.observe_stage('process_capture', name, seconds)
+        started = time.perf_counter()
+        # Count instances of each inventory item, carried to the borrow form as quantities
+        counts = count_equipment(result, model.names, get_inventory_dict())
+        request_metrics.observe_stage('process_capture', 'count', time.perf_counter() - started)
+        return {'counts': counts}
+
+    job = capture_jobs.submit(future, finish)
+    if wants_json:
+        status_url = url_for('capture_job', job_id=job.id)
+        return {'job_id': job.id, 'status': job.status, 'status_url': status_url}, 202, {'Location': status_url}
+    return redirect(url_for("borrow_return", job=job.id))
+
+@app.route('/capture_jobs/<job_id>')
+def capture_job(job_id):
+    """Return a capture job's status and, once it is done, the detected counts."""
+    job = capture_jobs.get(job_id)
+    if job is None:
+        return {'error': 'Unknown or expired capture job'}, 404
+    return job.to_dict()
+
 @app.route('/inventory', methods=['GET', 'POST'])
 def inventory():
-    conn = sqlite3.connect("database.db")
+    conn = get_db()
     c = conn.cursor()
     if request.method == 'POST':
         action = request.form.get('action')
@@ -473,6 +759,7 @@ def inventory():
                 try:
                     c.execute("INSERT INTO inventory (name, total_quantity, quantity) VALUES (?, ?, ?)", (name, total_quantity, total_quantity))
                     conn.commit()
+                    inventory_cache.invalidate()
                     flash("Equipment added successfully.")
                 except sqlite3.IntegrityError:
                     flash("Equipment already exists.")
@@ -490,133 +777,114 @@ def inventory():
                 new_available = available + difference
                 c.execute("UPDATE inventory SET total_quantity=?, quantity=? WHERE id=?", (total_quantity, new_available, item_id))
                 conn.commit()
+                inventory_cache.invalidate()
                 flash("Total quantity updated.")
         elif action == 'delete':
             item_id = request.form['item_id']
             c.execute("DELETE FROM inventory WHERE id=?", (item_id,))
             conn.commit()
+            inventory_cache.invalidate()
             flash("Equipment deleted.")
         return redirect(url_for('inventory'))
 
-    c.execute("SELECT id, name, total_quantity, quantity FROM inventory ORDER BY name ASC")
-    items = c.fetchall()
-    conn.close()
-    return render_template('inventory.html', items=items)
+    return render_template('inventory.html', items=get_inventory())
+
+@app.route('/student_suggestions')
+def student_suggestions():
+    """Autocomplete for student fields: students whose name, ID or course starts with what was typed."""
+    rows = search.suggest(get_db().cursor(), request.args.get('q', ''))
+    return {'students': [{'student_id': sid, 'name': name, 'course': course} for sid, name, course in rows]}
 
 @app.route('/records', methods=['GET', 'POST'])
 def records():
-    from datetime import datetime
-    from collections import OrderedDict
-    
-    logs = []
-    grouped_logs = OrderedDict()
-    search_query = ''
-    search_type = ''
-    
-    if request.method == 'POST':
-        search_query = request.form.get('search_query', '').strip()
-        search_type = request.form.get('search_type', 'id')
-        
-        if search_query:
-            conn = sqlite3.connect("database.db")
-            c = conn.cursor()
-            
-            if search_type == 'name':
-                # Search by student name
-                c.execute("""
-                    SELECT s.student_id, s.name, el.equipment_name, el.action, el.quantity, el.timestamp 
-                    FROM equipment_log el
-                    LEFT JOIN students s ON el.student_id = s.student_id
-                    WHERE s.name LIKE ? 
-                    ORDER BY el.timestamp DESC
-                """, (f'%{search_query}%',))
-            else:
-                # Search by student ID (default)
-                c.execute("""
-                    SELECT s.student_id, s.name, el.equipment_name, el.action, el.quantity, el.timestamp 
-                    FROM equipment_log el
-                    LEFT JOIN students s ON el.student_id = s.student_id
-                    WHERE el.student_id = ? 
-                    ORDER BY el.timestamp DESC
-                """, (search_query,))
-            
-            logs = c.fetchall()
-            conn.close()
-            
-            # Group logs by date
-            for log in logs:
-                # Extract date from timestamp (format: YYYY-MM-DD HH:MM:SS)
-                timestamp = log[5]
-                date_str = timestamp.split(' ')[0] if timestamp else 'Unknown'
-                
-                # Parse date for display
-                try:
-                    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                    date_display = date_obj.strftime('%A, %B %d, %Y')  # e.g., "Monday, January 15, 2024"
-                except:
-                    date_display = date_str
-                
-                if date_display not in grouped_logs:
-                    grouped_logs[date_display] = []
-                grouped_logs[date_display].append(log)
-    
-    return render_template('records.html', grouped_logs=grouped_logs, search_query=search_query, search_type=search_type)
+    # The search comes from the form (POST) or from a page link (GET)
+    search_query = request.values.get('search_query', '').strip()
+    search_type = request.values.get('search_type', 'id')
+    page = None
+
+    if search_query:
+        select = """
+            SELECT s.student_id, s.name, el.equipment_name, el.action, el.quantity, el.timestamp, el.id
+            FROM equipment_log el
+            LEFT JOIN students s ON el.student_id = s.student_id
+        """
+        if search_type == 'name':
+            # Search by student name, through the full-text index
+            condition, params = search.name_filter(get_db().cursor(), search_query)
+            where = [condition]
+        else:
+            # Search by student ID (default)
+            where, params = ["el.student_id = ?"], [search_query]
 
+        page = LogPage(get_db().cursor(), select, where, params,
+                       order=[('el.timestamp', 'DESC'), ('el.id', 'DESC')],
+                       key_columns=[5, 6], timestamp_column=5,
+                       after=request.args.get('after'))
 
-@app.route('/transaction_summary')
-def transaction_summary():
-    """Display transaction summary after successful borrow/return."""
-    student_id = request.args.get('student_id', '')
-    action = request.args.get('action', '')
-    items = request.args.get('items', '').split(',') if request.args.get('items') else []
-    quantities = request.args.get('quantities', '').split(',') if request.args.get('quantities') else []
-    total = int(request.args.get('total', 0))
-    
-    # Get student details
-    conn = sqlite3.connect("database.db")
+    return stream_template('records.html', page=page, search_query=search_query, search_type=search_type)
+
+
+@app.route('/transaction_summary/<int:transaction_id>')
+def transaction_summary(transaction_id):
+    """Display the summary of one borrow/return transaction."""
+    # Header, student and items in one indexed lookup
+    conn = get_db()
     c = conn.cursor()
-    c.execute("SELECT name, course, year_level FROM students WHERE student_id=?", (student_id,))
-    student_data = c.fetchone()
-    conn.close()
+    c.execute("""
+        SELECT t.student_id, t.action, datetime(t.timestamp, 'localtime'), s.name, s.course, s.year_level,
+               el.equipment_name, el.quantity
+        FROM transactions t
+        LEFT JOIN students s ON s.student_id = t.student_id
+        JOIN equipment_log el ON el.transaction_id = t.id
+        WHERE t.id = ?
+        ORDER BY el.id ASC
+    """, (transaction_id,))
+    rows = c.fetchall()
     
-    if not student_data:
-        flash("Student not found.")
+    if not rows:
+        flash("Transaction not found.")
         return redirect(url_for('borrow_return'))
     
-    student_name, course, year_level = student_data
+    # Stored in UTC (CURRENT_TIMESTAMP); shown in the server's local time
+    student_id, action, timestamp, student_name, course, year_level = rows[0][:6]
     
     # Prepare transaction items list
-    transaction_items = []
-    for item, qty in zip(items, quantities):
-        if item and qty:
-            transaction_items.append({
-                'name': item,
-                'quantity': int(qty)
-            })
+    transaction_items = [{'name': row[6], 'quantity': row[7]} for row in rows]
     
     # Prepare context data
     context = {
+        'transaction_id': transaction_id,
         'student_id': student_id,
         'student_name': student_name,
         'course': course,
         'year_level': year_level,
         'action': action,
-        'total_items': total,
+        'equipment_count': len(transaction_items),
+        'total_items': sum(item['quantity'] for item in transaction_items),
         'items': transaction_items,
-        'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        'timestamp': timestamp
     }
     
     return render_template('transaction_summary.html', **context)
 
 
+# Orderings offered on /admin_logs. Each ends in e.id so the keyset cursor is unique;
+# the second element is where each sort column sits in the selected row.
+ADMIN_LOG_SORTS = {
+    'timestamp_desc': ([('e.timestamp', 'DESC'), ('e.id', 'DESC')], [5, 0]),
+    'timestamp_asc': ([('e.timestamp', 'ASC'), ('e.id', 'ASC')], [5, 0]),
+    'student_id': ([('e.student_id', 'ASC'), ('e.timestamp', 'DESC'), ('e.id', 'DESC')], [1, 5, 0]),
+    'action': ([('e.action', 'ASC'), ('e.timestamp', 'DESC'), ('e.id', 'DESC')], [4, 5, 0]),
+}
+
+# /admin_logs shows "1000+ Records" rather than counting every matching row
+ADMIN_LOG_COUNT_CAP = 1000
+
 @app.route('/admin_logs', methods=['GET', 'POST'])
 def admin_logs():
     """Display transaction logs with filtering and sorting options."""
-    from datetime import datetime
-    from collections import OrderedDict
-    
     try:
-        conn = sqlite3.connect("database.db")
+        conn = get_db()
         c = conn.cursor()
         
         filters = {
@@ -626,118 +894,63 @@ def admin_logs():
             'sort': request.args.get('sort', 'timestamp_desc')
         }
         
-        # Build query with filters
-        query = """
-            SELECT e.id, e.student_id, s.name, e.equipment_name, e.action, e.timestamp
-            FROM equipment_log e
-            LEFT JOIN students s ON e.student_id = s.student_id
-            WHERE 1=1
-        """
+        # Build filters
+        where = []
         params = []
         
         if filters['student_id']:
-            query += " AND e.student_id = ?"
+            where.append("e.student_id = ?")
             params.append(filters['student_id'])
         
         if filters['equipment']:
-            query += " AND e.equipment_name LIKE ?"
+            where.append("e.equipment_name LIKE ?")
             params.append(f"%{filters['equipment']}%")
         
         if filters['action']:
-            query += " AND e.action = ?"
+            where.append("e.action = ?")
             params.append(filters['action'])
         
-        # Apply sorting
-        if filters['sort'] == 'timestamp_asc':
-            query += " ORDER BY e.timestamp ASC"
-        elif filters['sort'] == 'student_id':
-            query += " ORDER BY e.student_id ASC"
-        elif filters['sort'] == 'action':
-            query += " ORDER BY e.action ASC, e.timestamp DESC"
-        else:
-            query += " ORDER BY e.timestamp DESC"
-        
-        c.execute(query, params)
-        logs = c.fetchall()
+        # Counting stops at the cap, so a large log doesn't get scanned in full on every page
+        c.execute("SELECT COUNT(*) FROM (SELECT 1 FROM equipment_log e"
+                  + (" WHERE " + " AND ".join(where) if where else "") + " LIMIT ?)",
+                  params + [ADMIN_LOG_COUNT_CAP + 1])
+        total_count = c.fetchone()[0]
         
-        # Group logs by date
-        grouped_logs = OrderedDict()
-        for log in logs:
-            # Extract date from timestamp (format: YYYY-MM-DD HH:MM:SS)
-            timestamp = log[5]
-            date_str = timestamp.split(' ')[0] if timestamp else 'Unknown'
-            
-            # Parse date for display
-            try:
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                date_display = date_obj.strftime('%A, %B %d, %Y')  # e.g., "Monday, January 15, 2024"
-            except:
-                date_display = date_str
-            
-            if date_display not in grouped_logs:
-                grouped_logs[date_display] = []
-            grouped_logs[date_display].append(log)
-        
-        # Get unique values for filter dropdowns
-        c.execute("SELECT DISTINCT student_id FROM students ORDER BY student_id")
-        all_students = [s[0] for s in c.fetchall()]
-        
-        c.execute("SELECT DISTINCT equipment_name FROM equipment_log ORDER BY equipment_name")
-        all_equipment = [eq[0] for eq in c.fetchall()]
-        
-        conn.close()
-        
-        return render_template('admin_logs.html', 
-                             grouped_logs=grouped_logs,
-                             filters=filters,
-                             students=all_students,
-                             equipment=all_equipment)
+        # Apply sorting
+        order, key_columns = ADMIN_LOG_SORTS.get(filters['sort'], ADMIN_LOG_SORTS['timestamp_desc'])
+        page = LogPage(conn.cursor(), """
+            SELECT e.id, e.student_id, s.name, e.equipment_name, e.action, e.timestamp, e.transaction_id
+            FROM equipment_log e
+            LEFT JOIN students s ON e.student_id = s.student_id
+        """, where, params, order, key_columns, timestamp_column=5, after=request.args.get('after'))
     
     except Exception as e:
         print(f"Admin logs error: {str(e)}")
         flash(f"Error loading admin logs: {str(e)}")
         return redirect(url_for('home'))
+    
+    # Outside the try: the rows are fetched while the page streams, after this returns
+    return stream_template('admin_logs.html', 
+                         page=page,
+                         total_count=total_count,
+                         count_cap=ADMIN_LOG_COUNT_CAP,
+                         filters=filters)
 
 @app.route('/history')
 def history():
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
-    c.execute("""
-        SELECT el.student_id, s.name, el.equipment_name, el.action, el.quantity, el.timestamp 
+    page = LogPage(get_db().cursor(), """
+        SELECT el.student_id, s.name, el.equipment_name, el.action, el.quantity, el.timestamp, el.id, el.transaction_id
         FROM equipment_log el
         LEFT JOIN students s ON el.student_id = s.student_id
-        ORDER BY el.timestamp DESC
-    """)
-    logs = c.fetchall()
-    conn.close()
+    """, [], [], order=[('el.timestamp', 'DESC'), ('el.id', 'DESC')],
+        key_columns=[5, 6], timestamp_column=5, after=request.args.get('after'))
     
-    # Group logs by date
-    from datetime import datetime
-    from collections import OrderedDict
-    grouped_logs = OrderedDict()
-    
-    for log in logs:
-        # Extract date from timestamp (format: YYYY-MM-DD HH:MM:SS)
-        timestamp = log[5]
-        date_str = timestamp.split(' ')[0] if timestamp else 'Unknown'
-        
-        # Parse date for display
-        try:
-            date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-            date_display = date_obj.strftime('%A, %B %d, %Y')  # e.g., "Monday, January 15, 2024"
-        except:
-            date_display = date_str
-        
-        if date_display not in grouped_logs:
-            grouped_logs[date_display] = []
-        grouped_logs[date_display].append(log)
-    
-    return render_template('history.html', grouped_logs=grouped_logs)
+    return stream_template('history.html', page=page)
 
 @app.route('/registered_students')
 def registered_students():
     """Display all registered students."""
-    conn = sqlite3.connect("database.db")
+    conn = get_db()
     c = conn.cursor()
     
     # Get all students with their borrowing statistics
@@ -750,7 +963,7 @@ def registered_students():
             s.student_type,
             COUNT(CASE WHEN el.action='borrow' THEN 1 END) as total_borrows,
             COUNT(CASE WHEN el.action='return' THEN 1 END) as total_returns,
-            COALESCE(SUM(CASE WHEN el.action='borrow' THEN el.quantity ELSE -el.quantity END), 0) as currently_holding
+            COALESCE((SELECT SUM(h.qty) FROM holdings h WHERE h.student_id = s.student_id), 0) as currently_holding
         FROM students s
         LEFT JOIN equipment_log el ON s.student_id = el.student_id
         GROUP BY s.student_id, s.name, s.course, s.year_level, s.student_type
@@ -762,8 +975,6 @@ def registered_students():
     c.execute("SELECT COUNT(*) FROM students")
     total_students = c.fetchone()[0]
     
-    conn.close()
-    
     return render_template('registered_students.html', 
                          students=students,
                          total_students=total_students)
@@ -771,7 +982,7 @@ def registered_students():
 @app.route('/edit_student/<student_id>', methods=['GET', 'POST'])
 def edit_student(student_id):
     """Edit student information."""
-    conn = sqlite3.connect("database.db")
+    conn = get_db()
     c = conn.cursor()
     
     if request.method == 'POST':
@@ -814,13 +1025,14 @@ def edit_student(student_id):
             c.execute("SELECT student_id FROM students WHERE student_id=?", (new_student_id,))
             if c.fetchone():
                 flash("This Student ID already exists. Please use a unique ID.")
-                conn.close()
                 return redirect(url_for('edit_student', student_id=student_id))
         
         try:
-            # If student_id changed, update references in equipment_log
+            # If student_id changed, update references in equipment_log, holdings and transactions
             if new_student_id != student_id:
                 c.execute("UPDATE equipment_log SET student_id=? WHERE student_id=?", (new_student_id, student_id))
+                c.execute("UPDATE holdings SET student_id=? WHERE student_id=?", (new_student_id, student_id))
+                c.execute("UPDATE transactions SET student_id=? WHERE student_id=?", (new_student_id, student_id))
             
             # Update student information
             c.execute("""
@@ -829,20 +1041,17 @@ def edit_student(student_id):
                 WHERE student_id=?
             """, (new_student_id, name, course if course else None, year_level, student_type, student_id))
             conn.commit()
-            conn.close()
             
             flash("Student information updated successfully!")
             return redirect(url_for('registered_students'))
         except Exception as e:
             conn.rollback()
-            conn.close()
             flash(f"Error updating student: {str(e)}")
             return redirect(url_for('edit_student', student_id=student_id))
     
     # GET request - retrieve student info
     c.execute("SELECT student_id, name, course, year_level, student_type FROM students WHERE student_id=?", (student_id,))
     student = c.fetchone()
-    conn.close()
     
     if not student:
         flash("Student not found.")
@@ -850,10 +1059,47 @@ def edit_student(student_id):
     
     return render_template('edit_student.html', student=student)
 
+QUERY_SORTS = ('total', 'max', 'mean', 'calls', 'rows', 'slow')
+
+@app.route('/admin_queries', methods=['GET', 'POST'])
+def admin_queries():
+    """List the statements that took the most database time (LABCV_SQL_PROFILE=1)."""
+    if request.method == 'POST':
+        sqlprofile.profiler.reset()
+        flash("Query statistics cleared.")
+        return redirect(url_for('admin_queries'))
+    sort = request.args.get('sort', 'total')
+    if sort not in QUERY_SORTS:
+        sort = 'total'
+    return render_template('admin_queries.html',
+                           enabled=sqlprofile.ENABLED,
+                           statements=sqlprofile.profiler.top(sort),
+                           sort=sort,
+                           sorts=QUERY_SORTS,
+                           slow_ms=sqlprofile.profiler.slow_seconds * 1000.0,
+                           log_path=sqlprofile.profiler.log_path)
+
 # ---------- Run Server ----------
+def serve_production(host, port):
+    """Serve with waitress; returns False if it isn't installed."""
+    try:
+        from waitress import serve
+    except ImportError:
+        print("LABCV_SERVER=waitress but waitress is not installed (pip install waitress); "
+              "using the development server.")
+        return False
+    print(f"Serving on http://{host}:{port} with waitress ({SERVER_THREADS} threads, "
+          f"inference {'in a worker process' if INFERENCE_WORKER else 'in-process'})")
+    serve(app, host=host, port=port, threads=SERVER_THREADS)
+    return True
+
 if __name__ == '__main__':
+    # Needed for the inference worker process in the bundled labcv_backend.exe
+    multiprocessing.freeze_support()
     init_db()
+    start_inference()
     host = os.environ.get('FLASK_HOST', '127.0.0.1')
     port = int(os.environ.get('FLASK_PORT', '5000'))
     debug = os.environ.get('FLASK_DEBUG', 'False').lower() in ('1', 'true', 'yes')
-    app.run(host=host, port=port, debug=debug, use_reloader=False)
+    if SERVER != 'waitress' or not serve_production(host, port):
+        app.run(host=host, port=port, debug=debug, use_reloader=False)
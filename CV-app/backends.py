@@ -0,0 +1,343 @@
+"""
+Inference backends for the equipment detector.
+
+Every backend is called with a list of BGR frames and returns one Detections
+per frame, so the routes in app.py do not care which runtime produced them.
+
+    ultralytics  the PyTorch YOLO model from capstone.pt (default)
+    onnx         ONNX Runtime on CPU, exported once from capstone.pt; also
+                 runs the INT8 model built by scripts/quantize_model.py
+    openvino     OpenVINO IR on CPU, exported once from capstone.pt
+
+The backend is picked with the LABCV_BACKEND environment variable; input
+size and CPU thread counts come from LABCV_IMGSZ, LABCV_INTRA_OP_THREADS
+and LABCV_INTER_OP_THREADS. The ONNX
+and OpenVINO backends use the NumPy pre/post-processing and NMS below, with
+the same thresholds ultralytics uses by default.
+"""
+
+import ast
+import os
+import time
+
+import cv2
+import numpy as np
+
+BACKENDS = ('ultralytics', 'onnx', 'openvino')
+DEFAULT_BACKEND = os.environ.get('LABCV_BACKEND', 'ultralytics').lower()
+
+# ultralytics predict() defaults, mirrored so every backend returns the same boxes
+IMGSZ = 640
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+MAX_DET = 300
+MAX_WH = 7680  # offset that keeps boxes of different classes apart in NMS
+
+
+def _env_int(name, default=None):
+    value = os.environ.get(name, '').strip()
+    return int(value) if value else default
+
+
+# Startup configuration. Inference gets all cores but one by default, so the
+# Flask worker threads still have room; inter-op parallelism rarely helps a
+# single detection stream and only adds contention.
+DEFAULT_IMGSZ = _env_int('LABCV_IMGSZ')
+INTRA_OP_THREADS = _env_int('LABCV_INTRA_OP_THREADS', max(1, (os.cpu_count() or 2) - 1))
+INTER_OP_THREADS = _env_int('LABCV_INTER_OP_THREADS', 1)
+WARMUP_RUNS = _env_int('LABCV_WARMUP_RUNS', 3)
+
+
+class Detections:
+    """Boxes found in one frame.
+
+    xyxy is an (N, 4) float array of pixel corners in the original frame,
+    conf an (N,) float array and cls an (N,) int array of class ids. stages,
+    when the backend measured them, holds the seconds its batch spent in
+    'preprocess', 'inference' and 'postprocess'.
+    """
+
+    __slots__ = ('xyxy', 'conf', 'cls', 'stages')
+
+    def __init__(self, xyxy, conf, cls, stages=None):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+        self.stages = stages
+
+    def __len__(self):
+        return len(self.conf)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, int))
+
+
+# Stages of one model call, as reported per batch on each Detections
+STAGES = ('preprocess', 'inference', 'postprocess')
+
+
+class StageTimer:
+    """Times the stages of one batch for the backends that run their own pre/post-processing."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.stages[name] = time.perf_counter() - started
+        return result
+
+    def attach(self, results):
+        for detections in results:
+            detections.stages = self.stages
+        return results
+
+
+# ---------- Backends ----------
+class UltralyticsBackend:
+    """Runs the .pt weights through ultralytics YOLO (PyTorch)."""
+
+    name = 'ultralytics'
+
+    def __init__(self, weights_path, imgsz=None, intra_op_threads=None, inter_op_threads=None):
+        configure_torch_threads(intra_op_threads, inter_op_threads)
+        from ultralytics import YOLO
+        self.model = YOLO(weights_path)
+        self.imgsz = imgsz
+        self.conf_threshold = CONF_THRESHOLD
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def __call__(self, frames):
+        kwargs = {'verbose': False, 'conf': self.conf_threshold}
+        if self.imgsz:
+            kwargs['imgsz'] = self.imgsz
+        results = self.model(frames, **kwargs)
+        # ultralytics reports milliseconds per image, averaged over the batch
+        speed = results[0].speed if results else {}
+        stages = {name: speed.get(name, 0.0) * len(results) / 1000.0 for name in STAGES}
+        return [
+            Detections(r.boxes.xyxy.cpu().numpy(), r.boxes.conf.cpu().numpy(), r.boxes.cls.cpu().numpy().astype(int),
+                       stages)
+            for r in results
+        ]
+
+
+class OnnxBackend:
+    """Runs an exported .onnx model with ONNX Runtime on the CPU."""
+
+    name = 'onnx'
+
+    def __init__(self, weights_path, imgsz=None, intra_op_threads=None, inter_op_threads=None):
+        import onnxruntime as ort
+        self.imgsz = imgsz or IMGSZ
+        self.conf_threshold = CONF_THRESHOLD
+        onnx_path = weights_path if weights_path.endswith('.onnx') else export_model(weights_path, 'onnx', self.imgsz)
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.names = parse_names(self.session.get_modelmeta().custom_metadata_map.get('names'))
+
+    def __call__(self, frames):
+        timer = StageTimer()
+        batch, metas = timer.run('preprocess', preprocess, frames, self.imgsz)
+        output = timer.run('inference', self.session.run, None, {self.input_name: batch})[0]
+        return timer.attach(timer.run('postprocess', postprocess, output, metas, self.conf_threshold))
+
+
+class OpenVinoBackend:
+    """Runs an exported OpenVINO IR model on the CPU."""
+
+    name = 'openvino'
+
+    def __init__(self, weights_path, imgsz=None, intra_op_threads=None, inter_op_threads=None):
+        import openvino as ov
+        import yaml
+        self.imgsz = imgsz or IMGSZ
+        self.conf_threshold = CONF_THRESHOLD
+        model_dir = weights_path if os.path.isdir(weights_path) else export_model(weights_path, 'openvino', self.imgsz)
+        xml_path = next(os.path.join(model_dir, f) for f in os.listdir(model_dir) if f.endswith('.xml'))
+        config = {'INFERENCE_NUM_THREADS': intra_op_threads} if intra_op_threads else {}
+        self.compiled = ov.Core().compile_model(xml_path, 'CPU', config)
+        with open(os.path.join(model_dir, 'metadata.yaml')) as f:
+            self.names = parse_names(yaml.safe_load(f).get('names'))
+
+    def __call__(self, frames):
+        timer = StageTimer()
+        batch, metas = timer.run('preprocess', preprocess, frames, self.imgsz)
+        output = timer.run('inference', self.compiled, batch)[0]
+        return timer.attach(timer.run('postprocess', postprocess, output, metas, self.conf_threshold))
+
+
+BACKEND_CLASSES = {
+    'ultralytics': UltralyticsBackend,
+    'onnx': OnnxBackend,
+    'openvino': OpenVinoBackend,
+}
+
+
+def load_backend(weights_path, name=None, imgsz=None, intra_op_threads=None, inter_op_threads=None):
+    """Create the backend called ``name`` (default: LABCV_BACKEND) for the given weights.
+
+    Unset options fall back to the LABCV_* startup configuration.
+    """
+    name = (name or DEFAULT_BACKEND).lower()
+    if name not in BACKEND_CLASSES:
+        raise ValueError(f"Unknown inference backend '{name}'. Choose one of: {', '.join(BACKENDS)}")
+    return BACKEND_CLASSES[name](
+        weights_path,
+        imgsz=imgsz or DEFAULT_IMGSZ,
+        intra_op_threads=intra_op_threads or INTRA_OP_THREADS,
+        inter_op_threads=inter_op_threads or INTER_OP_THREADS,
+    )
+
+
+def configure_torch_threads(intra_op_threads, inter_op_threads):
+    """Pin torch's CPU thread pools. Inter-op threads can only be set once per process."""
+    import torch
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            pass  # already set, or parallel work has started
+
+
+def build_model(weights_path):
+    """Load the detector and warm it up so the first real scan doesn't stall."""
+    started = time.perf_counter()
+    model = load_backend(weights_path)
+    loaded = time.perf_counter()
+    warmup_seconds = warm_up(model)
+    print(f"Model ready: {model.name} backend, imgsz={model.imgsz or 'default'}, "
+          f"loaded in {loaded - started:.2f}s, warm-up {warmup_seconds:.2f}s")
+    return model
+
+
+def warm_up(backend, runs=WARMUP_RUNS):
+    """Run a few dummy frames at the configured input size so kernels and
+    allocators are initialised before the first real frame. Returns seconds spent."""
+    size = backend.imgsz or IMGSZ
+    frame = np.zeros((size, size, 3), np.uint8)
+    started = time.perf_counter()
+    for _ in range(runs):
+        backend([frame])
+    return time.perf_counter() - started
+
+
+def export_model(weights_path, fmt, imgsz=IMGSZ):
+    """Export .pt weights to ``fmt`` once and return the path of the cached export.
+
+    The export is written next to the weights (capstone.onnx,
+    capstone_openvino_model/) and reused until the weights change.
+    """
+    base = os.path.splitext(weights_path)[0]
+    target = base + '.onnx' if fmt == 'onnx' else base + '_openvino_model'
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(weights_path):
+        return target
+
+    from ultralytics import YOLO
+    print(f"Exporting {os.path.basename(weights_path)} to {fmt} (one-time)...")
+    return str(YOLO(weights_path).export(format=fmt, imgsz=imgsz, dynamic=True))
+
+
+def parse_names(raw):
+    """Turn class names from export metadata (a dict or its repr) into {id: name}."""
+    if isinstance(raw, str):
+        raw = ast.literal_eval(raw)
+    return {int(k): v for k, v in (raw or {}).items()}
+
+
+# ---------- Pre/post-processing ----------
+def preprocess(frames, imgsz):
+    """Letterbox BGR frames into one float32 NCHW RGB batch.
+
+    Returns the batch and, per frame, (gain, pad_x, pad_y, width, height)
+    for mapping boxes back onto the original frame.
+    """
+    batch = np.full((len(frames), imgsz, imgsz, 3), 114, np.uint8)
+    metas = []
+    for i, frame in enumerate(frames):
+        h, w = frame.shape[:2]
+        gain = min(imgsz / h, imgsz / w)
+        new_w, new_h = int(round(w * gain)), int(round(h * gain))
+        pad_x = int(round((imgsz - new_w) / 2 - 0.1))
+        pad_y = int(round((imgsz - new_h) / 2 - 0.1))
+        resized = frame if (new_w, new_h) == (w, h) else cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        batch[i, pad_y:pad_y + new_h, pad_x:pad_x + new_w] = resized
+        metas.append((gain, pad_x, pad_y, w, h))
+
+    # BGR -> RGB, HWC -> CHW, 0..255 -> 0..1 in a single pass
+    tensor = np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32)
+    tensor /= 255.0
+    return tensor, metas
+
+
+def postprocess(output, metas, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD, max_det=MAX_DET):
+    """Decode raw YOLO output of shape (B, 4 + classes, anchors) into Detections per frame."""
+    results = []
+    for pred, (gain, pad_x, pad_y, w, h) in zip(output.transpose(0, 2, 1), metas):
+        scores = pred[:, 4:]
+        cls = scores.argmax(1)
+        conf = scores[np.arange(len(scores)), cls]
+        keep = conf > conf_threshold
+        if not keep.any():
+            results.append(Detections.empty())
+            continue
+
+        cx, cy, bw, bh = pred[keep, :4].T
+        xyxy = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+        conf, cls = conf[keep], cls[keep]
+
+        idx = nms(xyxy + cls[:, None] * MAX_WH, conf, iou_threshold)[:max_det]
+        xyxy, conf, cls = xyxy[idx], conf[idx], cls[idx]
+
+        xyxy -= np.array([pad_x, pad_y, pad_x, pad_y], np.float32)
+        xyxy /= gain
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+        results.append(Detections(xyxy, conf, cls.astype(int)))
+    return results
+
+
+def deduplicate(detections, iou_threshold):
+    """Class-aware NMS over already decoded Detections (e.g. to merge duplicate boxes before counting)."""
+    if len(detections) < 2:
+        return detections
+    idx = np.sort(nms(detections.xyxy + detections.cls[:, None] * MAX_WH, detections.conf, iou_threshold))
+    return Detections(detections.xyxy[idx], detections.conf[idx], detections.cls[idx])
+
+
+def box_iou(box, boxes):
+    """IoU of one xyxy box against an (N, 4) array of boxes."""
+    xx1 = np.maximum(box[0], boxes[:, 0])
+    yy1 = np.maximum(box[1], boxes[:, 1])
+    xx2 = np.minimum(box[2], boxes[:, 2])
+    yy2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def nms(boxes, scores, iou_threshold):
+    """Greedy non-maximum suppression; returns kept indices, highest score first."""
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        rest = order[1:]
+        order = rest[box_iou(boxes[i], boxes[rest]) <= iou_threshold]
+    return np.array(keep, dtype=int)
@@ -0,0 +1,209 @@
+"""
+Bulk import and export of students, inventory and the equipment log.
+
+Imports read CSV (with a header row) or JSON Lines one row at a time, check
+every row with the same rules as the register/inventory forms, and insert
+the valid rows with chunked executemany inside a single transaction. Rows
+that fail validation are reported by line number and skipped; rows whose
+key already exists are left unchanged, as with the forms.
+
+Exports are generators that yield one CSV/JSONL line per row straight from
+the database cursor, so they never hold a whole table in memory.
+"""
+
+import csv
+import io
+import json
+
+from db import get_db
+
+CHUNK_SIZE = 500
+FORMATS = ('csv', 'jsonl')
+
+STUDENT_COLUMNS = ('student_id', 'name', 'course', 'year_level', 'student_type')
+INVENTORY_COLUMNS = ('name', 'total_quantity')
+
+EXPORTS = {
+    'students': ("SELECT student_id, name, course, year_level, student_type FROM students ORDER BY student_id",
+                 STUDENT_COLUMNS),
+    'inventory': ("SELECT name, total_quantity, quantity FROM inventory ORDER BY name",
+                  ('name', 'total_quantity', 'quantity')),
+    'logs': ("SELECT id, transaction_id, student_id, equipment_name, action, quantity, timestamp "
+             "FROM equipment_log ORDER BY id",
+             ('id', 'transaction_id', 'student_id', 'equipment_name', 'action', 'quantity', 'timestamp')),
+}
+
+
+def validate_year_level(year, student_type):
+    """Return the year level as an int (or None when blank); raise ValueError with the form's message."""
+    if year is None or str(year).strip() == '':
+        return None
+    try:
+        year = int(year)
+    except ValueError:
+        raise ValueError("Year level must be a valid number.")
+    # Validate year level based on student type
+    if student_type == 'ibed':
+        if year < 1 or year > 12:
+            raise ValueError("IBED student grade level must be between 1 and 12.")
+    elif student_type == 'college':
+        if year < 1:
+            raise ValueError("College student year level must be at least 1.")
+    return year
+
+
+def student_values(row):
+    """Validate an imported student row and return its column values."""
+    sid = (row.get('student_id') or '').strip()
+    name = (row.get('name') or '').strip()
+    if not sid:
+        raise ValueError("Student ID cannot be empty.")
+    if not name:
+        raise ValueError("Student name cannot be empty.")
+    student_type = (row.get('student_type') or 'college').strip()
+    if student_type not in ('college', 'ibed'):
+        raise ValueError(f"Unknown student type '{student_type}'.")
+    year = validate_year_level(row.get('year_level'), student_type)
+    course = (row.get('course') or '').strip() or None
+    return sid, name, course, year, student_type
+
+
+def inventory_values(row):
+    """Validate an imported inventory row and return its column values."""
+    name = (row.get('name') or '').strip()
+    if not name:
+        raise ValueError("Equipment name cannot be empty.")
+    try:
+        total_quantity = int(row.get('total_quantity') or 0)
+    except ValueError:
+        raise ValueError("Total quantity must be a whole number.")
+    if total_quantity < 0:
+        raise ValueError("Total quantity cannot be negative.")
+    return name, total_quantity, total_quantity
+
+
+IMPORTS = {
+    'students': ("INSERT OR IGNORE INTO students (student_id, name, course, year_level, student_type) VALUES (?, ?, ?, ?, ?)",
+                 student_values),
+    'inventory': ("INSERT OR IGNORE INTO inventory (name, total_quantity, quantity) VALUES (?, ?, ?)",
+                  inventory_values),
+}
+
+
+def read_rows(stream, fmt):
+    """Yield (line_number, dict) from a text stream in CSV or JSONL format.
+
+    Lines that can't be parsed are yielded as (line_number, ValueError).
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f"Invalid JSON: {e}")
+                continue
+            if not isinstance(row, dict):
+                yield line_number, ValueError("Each line must be a JSON object.")
+                continue
+            yield line_number, {key: (value if value is None else str(value)) for key, value in row.items()}
+    else:
+        raise ValueError(f"Unknown format '{fmt}', use one of: {', '.join(FORMATS)}")
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.errors = []     # (line_number, message)
+
+    @property
+    def skipped(self):
+        """Valid rows that already existed."""
+        return self.rows - len(self.errors) - self.imported
+
+
+def import_rows(kind, rows, conn=None, chunk_size=CHUNK_SIZE, dry_run=False):
+    """Validate and insert (line_number, dict) rows of students or inventory.
+
+    Everything is written in one transaction; with ``dry_run`` the rows are
+    only validated and the transaction is rolled back.
+    """
+    if kind not in IMPORTS:
+        raise ValueError(f"Can't import '{kind}', use one of: {', '.join(IMPORTS)}")
+    sql, to_values = IMPORTS[kind]
+    conn = conn or get_db()
+    c = conn.cursor()
+    result = ImportResult()
+    chunk = []
+
+    def flush():
+        c.executemany(sql, chunk)
+        # rowcount skips ignored duplicates (and rows written by triggers)
+        result.imported += c.rowcount
+        chunk.clear()
+
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        for line_number, row in rows:
+            result.rows += 1
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                chunk.append(to_values(row))
+            except ValueError as e:
+                result.errors.append((line_number, str(e)))
+                continue
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return result
+
+
+def export_rows(kind, fmt, conn=None):
+    """Yield a table as CSV or JSONL text, one line at a time."""
+    if kind not in EXPORTS:
+        raise ValueError(f"Can't export '{kind}', use one of: {', '.join(EXPORTS)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', use one of: {', '.join(FORMATS)}")
+    sql, columns = EXPORTS[kind]
+    cursor = (conn or get_db()).execute(sql)
+
+    if fmt == 'jsonl':
+        for row in cursor:
+            yield json.dumps(dict(zip(columns, row))) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    yield line(columns)
+    for row in cursor:
+        yield line(row)
+
+
+def guess_format(filename, default='csv'):
+    """Pick the format from a file name's extension."""
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return default
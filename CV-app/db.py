@@ -0,0 +1,66 @@
+"""
+Shared SQLite data-access layer.
+
+Every part of the app gets its connection from get_db(), which hands out one
+connection per thread and reuses it for the lifetime of that thread, instead
+of opening a fresh connection for every helper call. Connections use WAL
+journaling (readers don't block the writer), a busy timeout instead of
+failing immediately with "database is locked", and synchronous=NORMAL, which
+is safe with WAL and much cheaper per commit.
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+
+import sqlprofile
+
+# The database lives next to the app (or next to labcv_backend.exe when frozen),
+# never relative to whatever the current working directory happens to be.
+if getattr(sys, 'frozen', False):
+    APP_DIR = os.path.dirname(sys.executable)
+else:
+    APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DB_PATH = os.environ.get('LABCV_DB_PATH') or os.path.join(APP_DIR, 'database.db')
+BUSY_TIMEOUT_MS = int(os.environ.get('LABCV_DB_BUSY_TIMEOUT_MS', '5000'))
+
+_local = threading.local()
+
+
+def connect(path=None, **kwargs):
+    """Open a new connection with the app's pragmas applied."""
+    if sqlprofile.ENABLED:
+        kwargs.setdefault('factory', sqlprofile.ProfilingConnection)
+    conn = sqlite3.connect(path or DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000.0, **kwargs)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def get_db():
+    """Return this thread's connection, opening it on first use."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != DB_PATH:
+        if conn is not None:
+            conn.close()
+        conn = _local.conn = connect(DB_PATH)
+        _local.path = DB_PATH
+    return conn
+
+
+def release():
+    """Roll back anything a request left uncommitted, keeping the connection for reuse."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+
+def close():
+    """Close this thread's connection (e.g. before the thread exits)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
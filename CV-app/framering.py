@@ -0,0 +1,152 @@
+"""
+Shared-memory frame slots for the inference worker process.
+
+When detection runs in worker.py's separate process, pickling every decoded
+frame through the pipe would copy several megabytes per frame twice. Instead
+the web server owns a ring of preallocated frame slots in one
+``multiprocessing.shared_memory`` block, sized for the largest frame we
+accept. /process_frame decodes the upload into a free slot and the worker
+reads the pixels straight out of shared memory; only a few numbers (offset,
+shape, strides) cross the pipe.
+
+A slot is held for the whole request and handed back when it finishes. When
+every slot is busy a request waits briefly for one and is then turned away
+(back-pressure) rather than piling up more frames than the model can handle.
+Frames larger than a slot fall back to the pickled path.
+"""
+
+import atexit
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+FRAME_SLOTS = int(os.environ.get('LABCV_FRAME_SLOTS', '8'))
+FRAME_MAX_WIDTH, FRAME_MAX_HEIGHT = (int(v) for v in os.environ.get('LABCV_FRAME_MAX', '1920x1080').lower().split('x'))
+FRAME_SLOT_WAIT_MS = float(os.environ.get('LABCV_FRAME_SLOT_WAIT_MS', '250'))
+
+
+class RingFull(Exception):
+    """No frame slot became free in time."""
+
+
+class FrameRing:
+    """Fixed number of max-size BGR frame slots in one shared memory block."""
+
+    def __init__(self, slots=FRAME_SLOTS, max_width=FRAME_MAX_WIDTH, max_height=FRAME_MAX_HEIGHT):
+        self.slots = slots
+        self.max_width = max_width
+        self.max_height = max_height
+        self.slot_bytes = max_width * max_height * 3
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * self.slot_bytes)
+        self.name = self.shm.name
+        self._buffer = np.ndarray((slots * self.slot_bytes,), np.uint8, buffer=self.shm.buf)
+        self._base = self._buffer.__array_interface__['data'][0]
+        self._free = deque(range(slots))
+        self._cond = threading.Condition()
+        self._peak_in_use = 0
+        self._waits = 0
+        self._rejected = 0
+        self._oversize = 0
+        atexit.register(self.close)
+
+    def acquire(self, timeout=None):
+        """Take a free slot, waiting up to ``timeout`` seconds; returns its index or None."""
+        with self._cond:
+            if not self._free:
+                self._waits += 1
+                if not self._cond.wait_for(lambda: self._free, timeout):
+                    self._rejected += 1
+                    return None
+            slot = self._free.popleft()
+            self._peak_in_use = max(self._peak_in_use, self.slots - len(self._free))
+            return slot
+
+    def release(self, slot):
+        with self._cond:
+            self._free.append(slot)
+            self._cond.notify()
+
+    def view(self, slot, height, width):
+        """A (height, width, 3) uint8 array backed by the slot's shared memory."""
+        start = slot * self.slot_bytes
+        return self._buffer[start:start + height * width * 3].reshape(height, width, 3)
+
+    @contextmanager
+    def decode(self, data, timeout=FRAME_SLOT_WAIT_MS / 1000.0):
+        """Decode encoded image bytes into a free slot for the duration of the block.
+
+        Yields the BGR frame, or None if the bytes aren't an image. Raises
+        RingFull when no slot frees up within ``timeout`` seconds.
+        """
+        slot = self.acquire(timeout)
+        if slot is None:
+            raise RingFull()
+        try:
+            # cv2's Python API can't decode into a given buffer, so the decoded
+            # frame is copied into the slot once and then dropped
+            frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if frame is not None:
+                height, width = frame.shape[:2]
+                if width <= self.max_width and height <= self.max_height:
+                    view = self.view(slot, height, width)
+                    np.copyto(view, frame)
+                    frame = view
+                else:
+                    with self._cond:
+                        self._oversize += 1
+            yield frame
+        finally:
+            self.release(slot)
+
+    def describe(self, frame):
+        """Return (offset, shape, strides) if ``frame`` lives in this ring, else None.
+
+        Works for crops of a slot too, since they are views with their own strides.
+        """
+        if not isinstance(frame, np.ndarray) or frame.dtype != np.uint8:
+            return None
+        offset = frame.__array_interface__['data'][0] - self._base
+        if not 0 <= offset < len(self._buffer):
+            return None
+        return offset, frame.shape, frame.strides
+
+    def stats(self):
+        with self._cond:
+            return {
+                'slots': self.slots,
+                'in_use': self.slots - len(self._free),
+                'peak_in_use': self._peak_in_use,
+                'waits': self._waits,
+                'rejected': self._rejected,
+                'oversize_frames': self._oversize,
+                'max_frame': f"{self.max_width}x{self.max_height}",
+            }
+
+    def close(self):
+        if self.shm is None:
+            return
+        self._buffer = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = None
+
+
+class RingReader:
+    """Worker-process side: maps the ring by name and rebuilds frames from descriptors without copying."""
+
+    def __init__(self, name):
+        # The spawned worker shares the web server's resource tracker, so
+        # attaching here doesn't make the block outlive (or die with) the worker
+        self.shm = shared_memory.SharedMemory(name=name)
+
+    def frame(self, descriptor):
+        offset, shape, strides = descriptor
+        return np.ndarray(shape, np.uint8, buffer=self.shm.buf, offset=offset, strides=strides)
@@ -0,0 +1,92 @@
+"""
+Materialized per-student holdings.
+
+``holdings(student_id, equipment_name, qty)`` holds how many of each item a
+student currently has out. It is updated by log_actions() in the same
+transaction as the ``equipment_log`` rows it belongs to, so pending-equipment
+pages and return checks read one row instead of summing the student's whole
+borrowing history. The log stays the source of truth: verify() recomputes the
+holdings from it and reports any drift, and rebuild() rewrites the table.
+"""
+
+from db import get_db
+
+# Net quantity per student and item according to the log
+LOG_TOTALS_SQL = """
+    SELECT student_id, equipment_name, SUM(CASE WHEN action='borrow' THEN quantity ELSE -quantity END) AS qty
+    FROM equipment_log
+    GROUP BY student_id, equipment_name
+    HAVING qty != 0
+"""
+
+
+def log_actions(c, student_id, action, items):
+    """Record a borrow/return of (equipment_name, quantity) pairs and apply it to holdings.
+
+    Creates one ``transactions`` header and its ``equipment_log`` rows (all
+    with the header's timestamp) in the caller's transaction, with one
+    executemany per statement. Returns the transaction id.
+    """
+    items = list(items)
+    c.execute("INSERT INTO transactions (student_id, action) VALUES (?, ?)", (student_id, action))
+    transaction_id = c.lastrowid
+    c.executemany("""
+        INSERT INTO equipment_log (student_id, equipment_name, action, quantity, transaction_id, timestamp)
+        SELECT ?, ?, ?, ?, id, timestamp FROM transactions WHERE id = ?
+    """, [(student_id, equipment_name, action, quantity, transaction_id) for equipment_name, quantity in items])
+    sign = 1 if action == 'borrow' else -1
+    c.executemany("""
+        INSERT INTO holdings (student_id, equipment_name, qty) VALUES (?, ?, ?)
+        ON CONFLICT (student_id, equipment_name) DO UPDATE SET qty = qty + excluded.qty
+    """, [(student_id, equipment_name, sign * quantity) for equipment_name, quantity in items])
+    c.execute("DELETE FROM holdings WHERE student_id=? AND qty=0", (student_id,))
+    return transaction_id
+
+
+def held_quantities(c, student_id, equipment_names):
+    """Return {equipment_name: qty} the student has out, for the given items, in one query."""
+    equipment_names = list(equipment_names)
+    if not equipment_names:
+        return {}
+    marks = ', '.join('?' * len(equipment_names))
+    c.execute(f"SELECT equipment_name, qty FROM holdings WHERE student_id=? AND equipment_name IN ({marks})",
+              [student_id] + equipment_names)
+    return dict(c.fetchall())
+
+
+def verify(conn=None):
+    """Compare holdings with the log.
+
+    Returns a list of (student_id, equipment_name, holdings_qty, log_qty) for
+    every pair that disagrees; an empty list means the table is consistent.
+    """
+    conn = conn or get_db()
+    return conn.execute(f"""
+        WITH log AS ({LOG_TOTALS_SQL})
+        SELECT h.student_id, h.equipment_name, h.qty, COALESCE(log.qty, 0)
+        FROM holdings h
+        LEFT JOIN log ON log.student_id = h.student_id AND log.equipment_name = h.equipment_name
+        WHERE h.qty != COALESCE(log.qty, 0)
+        UNION ALL
+        SELECT log.student_id, log.equipment_name, 0, log.qty
+        FROM log
+        WHERE NOT EXISTS (
+            SELECT 1 FROM holdings h
+            WHERE h.student_id = log.student_id AND h.equipment_name = log.equipment_name
+        )
+        ORDER BY 1, 2
+    """).fetchall()
+
+
+def rebuild(conn=None):
+    """Recompute the holdings table from the log. Returns the number of rows written."""
+    conn = conn or get_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM holdings")
+        count = conn.execute(f"INSERT INTO holdings (student_id, equipment_name, qty) {LOG_TOTALS_SQL}").rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
@@ -0,0 +1,211 @@
+"""
+Inference scheduling for the equipment detector.
+
+Request threads hand frames to a single InferenceScheduler, whose worker
+thread collects whatever arrives within a short window and runs one batched
+model call, then hands each result back to the request that submitted it.
+
+The model itself is loaded by a ModelLoader on a background thread, so the
+web server can answer requests while torch and the weights are still
+loading.
+
+Frames can be tagged with a detection session. Only the newest queued frame
+of a session is kept: when a newer one arrives, the older one is dropped
+before it reaches the model and its waiter gets FrameSuperseded.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError, Future
+
+# How long the worker waits for more frames after the first one arrives,
+# and the largest batch it will send to the model at once.
+BATCH_WINDOW_MS = float(os.environ.get('LABCV_BATCH_WINDOW_MS', '15'))
+MAX_BATCH_SIZE = int(os.environ.get('LABCV_MAX_BATCH', '8'))
+
+# Raised from Future.result() for a frame replaced by a newer one of its session
+FrameSuperseded = CancelledError
+
+
+class ModelLoader:
+    """Loads the detector on a background thread and reports its readiness.
+
+    ``factory`` is called once, off the request threads, and must return the
+    model. Until it finishes ``model`` is None and ``ready`` is False.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.model = None
+        self.error = None
+        self.load_seconds = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.model is not None
+
+    def start(self):
+        """Start loading in the background; later calls are no-ops."""
+        with self._lock:
+            if self.ready or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._load, name='model-loader', daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        """Block until loading finished (or failed); returns ``ready``."""
+        self.start()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            model = self.factory()
+        except Exception as e:
+            self.error = str(e)
+            print(f"Model loading failed: {e}")
+        else:
+            self.model = model
+        self.load_seconds = round(time.perf_counter() - started, 2)
+
+    def status(self):
+        """Return 'ready', 'loading', 'failed' or 'idle'."""
+        if self.ready:
+            return 'ready'
+        if self.error:
+            return 'failed'
+        return 'loading' if self._thread is not None else 'idle'
+
+
+class InferenceScheduler:
+    """Queue plus worker thread that runs frames through the model in micro-batches.
+
+    ``predict`` is called with a list of frames and must return one result
+    per frame, in order (ultralytics ``model(frames)`` does exactly that).
+    """
+
+    def __init__(self, predict, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH_SIZE):
+        self.predict = predict
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._frames = 0
+        self._batches = 0
+        self._last_batch_size = 0
+        self._max_queue_depth = 0
+        self._batch_sizes = {}
+        self._superseded = 0
+        self._latest = {}  # session -> Future of its newest queued frame
+
+    def start(self):
+        """Start the worker thread if it is not running yet."""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+                self._worker.start()
+
+    def submit(self, frame, session=None):
+        """Queue a frame and return a Future that resolves to its result.
+
+        If ``session`` already has a frame waiting in the queue, that frame is
+        superseded: it is never run and its Future is cancelled.
+        """
+        self.start()
+        future = Future()
+        with self._lock:
+            if session is not None:
+                previous = self._latest.get(session)
+                if previous is not None and previous.cancel():
+                    self._superseded += 1
+                self._latest[session] = future
+            self._queue.put((frame, future, session, time.perf_counter()))
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return future
+
+    def infer(self, frame, session=None, timeout=None):
+        """Submit a frame and block until its result is ready.
+
+        Raises FrameSuperseded if a newer frame of the same session replaced it.
+        """
+        return self.submit(frame, session).result(timeout=timeout)
+
+    def _collect(self):
+        """Block for one frame, then gather more until the window closes or the batch is full."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _claim(self, batch):
+        """Mark collected frames as running, dropping any that were superseded meanwhile."""
+        live = []
+        with self._lock:
+            for frame, future, session, queued in batch:
+                if session is not None and self._latest.get(session) is future:
+                    del self._latest[session]
+                if future.set_running_or_notify_cancel():
+                    live.append((frame, future, queued))
+        return live
+
+    def _run(self):
+        while True:
+            batch = self._claim(self._collect())
+            if not batch:
+                continue
+            frames = [frame for frame, _, _ in batch]
+            started = time.perf_counter()
+            try:
+                results = list(self.predict(frames))
+                if len(results) != len(frames):
+                    raise RuntimeError(f"Model returned {len(results)} results for {len(frames)} frames")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                model_s = time.perf_counter() - started
+                for (_, future, queued), result in zip(batch, results):
+                    # Seconds spent waiting for a batch and running it, for the latency metrics
+                    future.stages = {'queue': started - queued, 'model': model_s}
+                    # The backend's own breakdown of the model call, if it measured one
+                    for name, seconds in (getattr(result, 'stages', None) or {}).items():
+                        future.stages[f'model_{name}'] = seconds
+                    future.set_result(result)
+            self._record_batch(len(batch))
+
+    def _record_batch(self, size):
+        with self._lock:
+            self._frames += size
+            self._batches += 1
+            self._last_batch_size = size
+            self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+
+    def stats(self):
+        """Return queue-depth and batch-size counters as a plain dict."""
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'frames': self._frames,
+                'batches': self._batches,
+                'last_batch_size': self._last_batch_size,
+                'avg_batch_size': round(self._frames / self._batches, 2) if self._batches else 0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'superseded': self._superseded,
+                'window_ms': self.window * 1000.0,
+                'max_batch': self.max_batch,
+            }
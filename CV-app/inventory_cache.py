@@ -0,0 +1,77 @@
+"""
+In-memory copy of the inventory table.
+
+The live detector filters every frame against the inventory, and the borrow
+form lists it on every load, yet the table only changes when an admin edits
+it or someone borrows/returns. InventoryCache keeps the rows in memory and
+hands out the same snapshot until it is invalidated:
+
+* writes in this process call invalidate() right after they commit;
+* writes from other processes (manage.py, a second server) are noticed
+  through ``PRAGMA data_version`` on the cache's own connection, checked at
+  most every LABCV_INVENTORY_RECHECK_S seconds.
+
+Between those checks a lookup never touches the database.
+"""
+
+import os
+import threading
+import time
+
+import db
+
+RECHECK_SECONDS = float(os.environ.get('LABCV_INVENTORY_RECHECK_S', '1.0'))
+
+
+class InventoryCache:
+    def __init__(self, recheck=RECHECK_SECONDS):
+        self.recheck = recheck
+        self.version = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._path = None
+        self._data_version = None
+        self._snapshot = None
+        self._checked = 0.0
+
+    def invalidate(self):
+        """Drop the cached rows; the next lookup reloads them."""
+        with self._lock:
+            self._snapshot = None
+
+    def snapshot(self):
+        """Return (version, rows, by_name).
+
+        ``rows`` are (id, name, total_quantity, quantity) ordered by name and
+        ``by_name`` maps name -> available quantity. Both are shared between
+        callers and must not be modified.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._snapshot is not None and self._path == db.DB_PATH and now - self._checked < self.recheck:
+                return self._snapshot
+
+            if self._conn is None or self._path != db.DB_PATH:
+                if self._conn is not None:
+                    self._conn.close()
+                # Only ever used under self._lock
+                self._conn = db.connect(db.DB_PATH, check_same_thread=False)
+                self._path = db.DB_PATH
+                self._snapshot = None
+
+            # data_version changes whenever another connection commits
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            self._checked = now
+            if self._snapshot is None or data_version != self._data_version:
+                rows = self._conn.execute(
+                    "SELECT id, name, total_quantity, quantity FROM inventory ORDER BY name ASC").fetchall()
+                self._data_version = data_version
+                self.version += 1
+                self._snapshot = (self.version, rows, {name: qty for _, name, _, qty in rows})
+            return self._snapshot
+
+    def rows(self):
+        return self.snapshot()[1]
+
+    def by_name(self):
+        return self.snapshot()[2]
@@ -0,0 +1,106 @@
+"""
+Background capture jobs.
+
+/process_capture used to run the model inside the POST handler, so a slow
+CPU inference held the request (and the kiosk page) for its whole duration.
+Now the handler hands the frame to the InferenceScheduler, registers the
+returned Future here under a random job ID and answers straight away. The
+borrow page polls the job until its result is ready.
+
+Finished and unfinished jobs alike are forgotten LABCV_JOB_TTL_S seconds
+after they were created, so results nobody came back for don't pile up.
+"""
+
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+JOB_TTL_S = float(os.environ.get('LABCV_JOB_TTL_S', '300'))
+MAX_JOBS = 256
+
+
+class Job:
+    __slots__ = ('id', 'created', 'status', 'result', 'error', 'done')
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.created = time.monotonic()
+        self.status = 'pending'
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        data = {'job_id': self.id, 'status': self.status}
+        if self.status == 'done':
+            data.update(self.result)
+        elif self.status == 'failed':
+            data['error'] = self.error
+        return data
+
+
+class JobStore:
+    """Job ID -> Job, oldest first; expired jobs are dropped whenever the store is used."""
+
+    def __init__(self, ttl=JOB_TTL_S, max_jobs=MAX_JOBS):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._expired = 0
+
+    def submit(self, future, finish):
+        """Track ``future``; when it resolves, ``finish(result)`` builds the job's result dict.
+
+        Returns the new job. ``finish`` runs on the thread that resolves the
+        future, so it should be quick.
+        """
+        job = Job(secrets.token_urlsafe(12))
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+            self._created += 1
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+                self._expired += 1
+
+        def resolved(future):
+            try:
+                job.result = finish(future.result())
+                job.status = 'done'
+            except Exception as e:
+                job.error = str(e) or type(e).__name__
+                job.status = 'failed'
+            job.done.set()
+
+        future.add_done_callback(resolved)
+        return job
+
+    def get(self, job_id):
+        """Return the job, or None if it is unknown or has expired."""
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def _purge(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            if job.created > cutoff:
+                break
+            self._jobs.popitem(last=False)
+            self._expired += 1
+
+    def stats(self):
+        with self._lock:
+            self._purge()
+            return {
+                'jobs': len(self._jobs),
+                'pending': sum(1 for job in self._jobs.values() if job.status == 'pending'),
+                'created': self._created,
+                'expired': self._expired,
+                'ttl_s': self.ttl,
+            }
@@ -0,0 +1,113 @@
+"""
+Maintenance commands for the LabCV database.
+
+Usage (from the CV-app folder):
+    python manage.py migrate        # create/upgrade the schema
+    python manage.py migrations     # list the migrations that have run
+    python manage.py holdings       # check the holdings table against the log
+    python manage.py holdings --rebuild
+    python manage.py search-index   # rebuild the student search index
+    python manage.py import students students.csv [--dry-run]
+    python manage.py export logs logs.jsonl     # or '-' for stdout
+"""
+
+import argparse
+import sys
+
+import bulk
+import holdings
+import migrations
+import search
+
+
+def cmd_migrate(args):
+    applied = migrations.migrate()
+    for name in applied:
+        print(f"Applied migration: {name}")
+    print(f"Database is at schema version {migrations.current_version()}.")
+
+
+def cmd_migrations(args):
+    rows = migrations.applied_migrations()
+    if not rows:
+        print("No migrations have run yet. Use: python manage.py migrate")
+    for version, name, applied_at in rows:
+        print(f"{version:>3}  {name:<30} {applied_at}")
+
+
+def cmd_holdings(args):
+    drift = holdings.verify()
+    for student_id, equipment_name, held, logged in drift:
+        print(f"{student_id:<15} {equipment_name:<30} holdings={held:<5} log={logged}")
+    if not drift:
+        print("Holdings match the equipment log.")
+    elif not args.rebuild:
+        print(f"{len(drift)} holdings row(s) drifted from the log. Fix with: python manage.py holdings --rebuild")
+
+    if args.rebuild:
+        count = holdings.rebuild()
+        print(f"Rebuilt holdings from the log ({count} rows).")
+    elif drift:
+        sys.exit(1)
+
+
+def cmd_search_index(args):
+    count = search.rebuild_index()
+    if count is None:
+        print("No student search index (this SQLite has no FTS5); name search uses LIKE.")
+    else:
+        print(f"Rebuilt the student search index ({count} students).")
+
+
+def cmd_import(args):
+    fmt = args.format or bulk.guess_format(args.file)
+    with open(args.file, encoding='utf-8-sig', newline='') as f:
+        result = bulk.import_rows(args.kind, bulk.read_rows(f, fmt), dry_run=args.dry_run)
+    for line_number, message in result.errors:
+        print(f"line {line_number}: {message}")
+    verb = "would be imported" if args.dry_run else "imported"
+    print(f"{result.rows} row(s) read: {result.imported} {verb}, "
+          f"{result.skipped} already existed, {len(result.errors)} rejected.")
+    if result.errors:
+        sys.exit(1)
+
+
+def cmd_export(args):
+    fmt = args.format or bulk.guess_format(args.file)
+    if args.file == '-':
+        sys.stdout.writelines(bulk.export_rows(args.kind, fmt))
+        return
+    with open(args.file, 'w', encoding='utf-8', newline='') as f:
+        f.writelines(bulk.export_rows(args.kind, fmt))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('migrate', help='create or upgrade the schema').set_defaults(func=cmd_migrate)
+    commands.add_parser('migrations', help='list applied migrations').set_defaults(func=cmd_migrations)
+    holdings_cmd = commands.add_parser('holdings', help='verify (or rebuild) the holdings table')
+    holdings_cmd.add_argument('--rebuild', action='store_true', help='recompute holdings from the equipment log')
+    holdings_cmd.set_defaults(func=cmd_holdings)
+
+    commands.add_parser('search-index', help='rebuild the student search index').set_defaults(func=cmd_search_index)
+
+    import_cmd = commands.add_parser('import', help='bulk-import students or inventory from CSV/JSONL')
+    import_cmd.add_argument('kind', choices=sorted(bulk.IMPORTS))
+    import_cmd.add_argument('file')
+    import_cmd.add_argument('--format', choices=bulk.FORMATS, help='default: from the file extension')
+    import_cmd.add_argument('--dry-run', action='store_true', help='only validate, write nothing')
+    import_cmd.set_defaults(func=cmd_import)
+
+    export_cmd = commands.add_parser('export', help='export a table as CSV/JSONL')
+    export_cmd.add_argument('kind', choices=sorted(bulk.EXPORTS))
+    export_cmd.add_argument('file', nargs='?', default='-', help="output file, '-' for stdout (default)")
+    export_cmd.add_argument('--format', choices=bulk.FORMATS, help='default: from the file extension, else csv')
+    export_cmd.set_defaults(func=cmd_export)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Request and stage latency metrics.
+
+Every request is timed from before_request until its response body has been
+sent (for streamed pages that includes rendering them) and counted by
+endpoint, method and status; 5xx responses also count as errors. Routes can
+time their own stages (reading the upload, decoding, waiting for the model,
+...) with ``RequestTimer.stage()``. Durations go into per-series windows of
+the most recent LABCV_METRICS_WINDOW samples, from which p50/p95/p99 are
+computed.
+
+/metrics serves all of it in the Prometheus text format (latencies as
+summaries). With LABCV_SERVER_TIMING on, each response also carries a
+``Server-Timing`` header with its own stages, which browser dev tools and
+the detection window show. Headers go out before the body, so on streamed
+pages the header only covers the view function; /metrics has the full time.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+METRICS_WINDOW = int(os.environ.get('LABCV_METRICS_WINDOW', '1024'))
+SERVER_TIMING = os.environ.get('LABCV_SERVER_TIMING', '1').lower() in ('1', 'true', 'yes')
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Series:
+    """Count and sum of all observations plus a window of recent ones for quantiles."""
+
+    __slots__ = ('count', 'total', 'samples')
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+
+    def quantiles(self):
+        if not self.samples:
+            return {q: 0.0 for q in QUANTILES}
+        values = np.quantile(np.fromiter(self.samples, float, len(self.samples)), QUANTILES)
+        return dict(zip(QUANTILES, values.tolist()))
+
+
+class RequestTimer:
+    """Stage timings of one request, in the order they finished."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []  # (name, seconds)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.stages.append((name, seconds))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total):
+        """The ``Server-Timing`` header value, durations in milliseconds."""
+        parts = [f'{name};dur={seconds * 1000.0:.1f}' for name, seconds in self.stages]
+        parts.append(f'total;dur={total * 1000.0:.1f}')
+        return ', '.join(parts)
+
+
+class Registry:
+    """Request counts, error counts and latency series for the whole server."""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._requests = {}   # (endpoint, method, status) -> count
+        self._errors = {}     # endpoint -> count
+        self._durations = {}  # endpoint -> Series
+        self._stages = {}     # (endpoint, stage) -> Series
+
+    def _series(self, table, key):
+        series = table.get(key)
+        if series is None:
+            series = table[key] = Series(self.window)
+        return series
+
+    def observe_request(self, endpoint, method, status, seconds, stages=()):
+        with self._lock:
+            key = (endpoint, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            if status >= 500:
+                self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+            self._series(self._durations, endpoint).observe(seconds)
+            for name, stage_seconds in stages:
+                self._series(self._stages, (endpoint, name)).observe(stage_seconds)
+
+    def observe_stage(self, endpoint, name, seconds):
+        """Record a stage that finished outside a request (e.g. a background capture job)."""
+        with self._lock:
+            self._series(self._stages, (endpoint, name)).observe(seconds)
+
+    def snapshot(self):
+        """Return {endpoint: {'count', 'errors', 'p50', 'p95', 'p99', 'stages': {...}}} in seconds."""
+        with self._lock:
+            def summary(series):
+                quantiles = series.quantiles()
+                return {'count': series.count, 'p50': quantiles[0.5], 'p95': quantiles[0.95], 'p99': quantiles[0.99]}
+
+            endpoints = {}
+            for endpoint, series in self._durations.items():
+                endpoints[endpoint] = dict(summary(series), errors=self._errors.get(endpoint, 0), stages={})
+            for (endpoint, name), series in self._stages.items():
+                endpoints.setdefault(endpoint, {'count': 0, 'errors': 0, 'stages': {}})['stages'][name] = summary(series)
+            return endpoints
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines.append('# HELP labcv_requests_total Requests handled, by endpoint, method and status.')
+            lines.append('# TYPE labcv_requests_total counter')
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                lines.append(f'labcv_requests_total{{endpoint="{_label(endpoint)}",method="{method}",status="{status}"}} {count}')
+
+            lines.append('# HELP labcv_request_errors_total Requests that ended in a 5xx response.')
+            lines.append('# TYPE labcv_request_errors_total counter')
+            for endpoint, count in sorted(self._errors.items()):
+                lines.append(f'labcv_request_errors_total{{endpoint="{_label(endpoint)}"}} {count}')
+
+            lines.append('# HELP labcv_request_duration_seconds Time to handle a request.')
+            lines.append('# TYPE labcv_request_duration_seconds summary')
+            for endpoint, series in sorted(self._durations.items()):
+                _summary(lines, 'labcv_request_duration_seconds', f'endpoint="{_label(endpoint)}"', series)
+
+            lines.append('# HELP labcv_stage_duration_seconds Time spent in one stage of a request.')
+            lines.append('# TYPE labcv_stage_duration_seconds summary')
+            for (endpoint, name), series in sorted(self._stages.items()):
+                _summary(lines, 'labcv_stage_duration_seconds', f'endpoint="{_label(endpoint)}",stage="{_label(name)}"', series)
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _summary(lines, metric, labels, series):
+    for q, value in series.quantiles().items():
+        lines.append(f'{metric}{{{labels},quantile="{q}"}} {value:.6f}')
+    lines.append(f'{metric}_sum{{{labels}}} {series.total:.6f}')
+    lines.append(f'{metric}_count{{{labels}}} {series.count}')
@@ -0,0 +1,237 @@
+"""
+Versioned schema migrations.
+
+The schema version of a database is kept in ``PRAGMA user_version``. Each
+migration below runs once, in order, inside its own transaction, and is
+recorded in the ``schema_migrations`` table together with when it ran.
+To change the schema, append a new migration; never edit one that shipped.
+"""
+
+import sqlite3
+
+from db import get_db
+
+
+def _columns(c, table):
+    return {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+
+
+def initial_schema(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS students (
+            student_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            course TEXT,
+            year_level INTEGER,
+            student_type TEXT DEFAULT 'college'
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS equipment_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id TEXT NOT NULL,
+            equipment_name TEXT NOT NULL,
+            action TEXT CHECK(action IN ('borrow', 'return')),
+            quantity INTEGER DEFAULT 1,
+            timestamp TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS inventory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            total_quantity INTEGER DEFAULT 0,
+            quantity INTEGER DEFAULT 0
+        )
+    ''')
+
+
+def add_missing_columns(c):
+    """Bring databases created by older versions of the app up to the initial schema."""
+    if 'quantity' not in _columns(c, 'equipment_log'):
+        c.execute("ALTER TABLE equipment_log ADD COLUMN quantity INTEGER DEFAULT 1")
+    if 'student_type' not in _columns(c, 'students'):
+        c.execute("ALTER TABLE students ADD COLUMN student_type TEXT DEFAULT 'college'")
+    if 'total_quantity' not in _columns(c, 'inventory'):
+        c.execute("ALTER TABLE inventory ADD COLUMN total_quantity INTEGER DEFAULT 0")
+        # For existing items, set total_quantity equal to current quantity
+        c.execute("UPDATE inventory SET total_quantity = quantity WHERE total_quantity = 0")
+
+
+def equipment_log_indexes(c):
+    # Pending equipment / return checks: WHERE student_id=? GROUP BY equipment_name
+    c.execute("CREATE INDEX IF NOT EXISTS idx_equipment_log_student_equipment ON equipment_log (student_id, equipment_name)")
+    # Student records: WHERE student_id=? ORDER BY timestamp
+    c.execute("CREATE INDEX IF NOT EXISTS idx_equipment_log_student_timestamp ON equipment_log (student_id, timestamp)")
+    # History and admin logs: ORDER BY timestamp over the whole log
+    c.execute("CREATE INDEX IF NOT EXISTS idx_equipment_log_timestamp ON equipment_log (timestamp)")
+    # Admin logs filtered by equipment or action, newest first
+    c.execute("CREATE INDEX IF NOT EXISTS idx_equipment_log_equipment_timestamp ON equipment_log (equipment_name, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_equipment_log_action_timestamp ON equipment_log (action, timestamp)")
+
+
+def holdings_table(c):
+    """Materialized per-student holdings (see holdings.py), seeded from the existing log."""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS holdings (
+            student_id TEXT NOT NULL,
+            equipment_name TEXT NOT NULL,
+            qty INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (student_id, equipment_name)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        INSERT INTO holdings (student_id, equipment_name, qty)
+        SELECT student_id, equipment_name, SUM(CASE WHEN action='borrow' THEN quantity ELSE -quantity END) AS qty
+        FROM equipment_log
+        GROUP BY student_id, equipment_name
+        HAVING qty != 0
+    ''')
+
+
+def transactions_table(c):
+    """Group the rows of one multi-item borrow/return under a transactions header."""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id TEXT NOT NULL,
+            action TEXT CHECK(action IN ('borrow', 'return')),
+            timestamp TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_student_timestamp ON transactions (student_id, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_timestamp ON transactions (timestamp)")
+    if 'transaction_id' not in _columns(c, 'equipment_log'):
+        c.execute("ALTER TABLE equipment_log ADD COLUMN transaction_id INTEGER REFERENCES transactions (id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_equipment_log_transaction ON equipment_log (transaction_id)")
+
+    # Older rows of one transaction only share student, action and timestamp
+    c.execute('''
+        INSERT INTO transactions (student_id, action, timestamp)
+        SELECT student_id, action, timestamp
+        FROM equipment_log
+        WHERE transaction_id IS NULL
+        GROUP BY student_id, action, timestamp
+        ORDER BY MIN(id)
+    ''')
+    c.execute('''
+        UPDATE equipment_log SET transaction_id = (
+            SELECT t.id FROM transactions t
+            WHERE t.student_id = equipment_log.student_id
+              AND t.timestamp IS equipment_log.timestamp
+              AND t.action IS equipment_log.action
+        )
+        WHERE transaction_id IS NULL
+    ''')
+
+
+def students_search_index(c):
+    """FTS5 index over students (name, student_id, course), kept in sync by triggers.
+
+    students has a TEXT primary key, and its implicit rowid can change on
+    VACUUM, so the index is keyed on students_search_keys instead: a stable
+    integer per student_id. Triggers then update the index by rowid.
+    Skipped when this SQLite build has no FTS5; search then falls back to LIKE.
+    """
+    try:
+        c.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5 (
+                name, student_id, course,
+                tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"Student search index not created ({e}); name search will be slower.")
+        return
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS students_search_keys (
+            id INTEGER PRIMARY KEY,
+            student_id TEXT NOT NULL UNIQUE
+        )
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students BEGIN
+            INSERT OR IGNORE INTO students_search_keys (student_id) VALUES (new.student_id);
+            INSERT INTO students_fts (rowid, name, student_id, course)
+            SELECT id, new.name, new.student_id, new.course FROM students_search_keys WHERE student_id = new.student_id;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students BEGIN
+            DELETE FROM students_fts WHERE rowid = (SELECT id FROM students_search_keys WHERE student_id = old.student_id);
+            DELETE FROM students_search_keys WHERE student_id = old.student_id;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE ON students BEGIN
+            DELETE FROM students_fts WHERE rowid = (SELECT id FROM students_search_keys WHERE student_id = old.student_id);
+            UPDATE students_search_keys SET student_id = new.student_id WHERE student_id = old.student_id;
+            INSERT INTO students_fts (rowid, name, student_id, course)
+            SELECT id, new.name, new.student_id, new.course FROM students_search_keys WHERE student_id = new.student_id;
+        END
+    ''')
+    c.execute("INSERT OR IGNORE INTO students_search_keys (student_id) SELECT student_id FROM students")
+    c.execute('''
+        INSERT INTO students_fts (rowid, name, student_id, course)
+        SELECT k.id, s.name, s.student_id, s.course
+        FROM students s JOIN students_search_keys k ON k.student_id = s.student_id
+    ''')
+
+
+# (version, name, function) - append only
+MIGRATIONS = [
+    (1, 'initial_schema', initial_schema),
+    (2, 'add_missing_columns', add_missing_columns),
+    (3, 'equipment_log_indexes', equipment_log_indexes),
+    (4, 'holdings_table', holdings_table),
+    (5, 'transactions_table', transactions_table),
+    (6, 'students_search_index', students_search_index),
+]
+
+
+def current_version(conn=None):
+    conn = conn or get_db()
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn=None):
+    """Apply every migration newer than the database's user_version.
+
+    Returns the names of the migrations that ran.
+    """
+    conn = conn or get_db()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    applied = []
+    for version, name, func in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+        c = conn.cursor()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            if version <= current_version(conn):
+                # Another process applied it while we waited for the write lock
+                conn.rollback()
+                continue
+            func(c)
+            c.execute("INSERT OR REPLACE INTO schema_migrations (version, name) VALUES (?, ?)", (version, name))
+            c.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(name)
+    return applied
+
+
+def applied_migrations(conn=None):
+    """Return (version, name, applied_at) rows of the migrations that have run."""
+    conn = conn or get_db()
+    return conn.execute("SELECT version, name, applied_at FROM schema_migrations ORDER BY version").fetchall()
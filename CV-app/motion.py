@@ -0,0 +1,148 @@
+"""
+Motion gating for the live detector.
+
+Before a frame goes to the model it is compared with the last frame that was
+actually processed for the same detection session, using a small blurred
+grayscale thumbnail. If hardly anything changed (the camera is looking at an
+empty or untouched counter) the previous detections are reused instead of
+running the model. Optionally, when the change is confined to one part of the
+picture, only that region is sent to the model and merged with the previous
+detections for the rest of the frame.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from backends import Detections
+
+MOTION_GATE_ENABLED = os.environ.get('LABCV_MOTION_GATE', '1').lower() in ('1', 'true', 'yes')
+MOTION_ROI_ENABLED = os.environ.get('LABCV_MOTION_ROI', '0').lower() in ('1', 'true', 'yes')
+# Share of thumbnail pixels that must change before the model runs again
+MOTION_MIN_CHANGED = float(os.environ.get('LABCV_MOTION_MIN_CHANGED', '0.005'))
+# Run the model at least every N frames even when nothing moves
+MOTION_MAX_REUSE = int(os.environ.get('LABCV_MOTION_MAX_REUSE', '30'))
+
+THUMB_SIZE = (160, 90)
+PIXEL_DIFF = 25          # grey-level change that counts a thumbnail pixel as changed
+ROI_MARGIN = 0.15        # grow the changed region by this share of the frame on each side
+ROI_MAX_AREA = 0.5       # larger changes just run the model on the whole frame
+MAX_SESSIONS = 64
+
+
+class _SessionState:
+    __slots__ = ('thumb', 'result', 'reused')
+
+    def __init__(self, thumb, result):
+        self.thumb = thumb
+        self.result = result
+        self.reused = 0
+
+
+class MotionGate:
+    """Remembers the last processed thumbnail and detections of each session."""
+
+    def __init__(self, min_changed=MOTION_MIN_CHANGED, max_reuse=MOTION_MAX_REUSE, roi=MOTION_ROI_ENABLED):
+        self.min_changed = min_changed
+        self.max_reuse = max_reuse
+        self.roi_enabled = roi
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._reused = 0
+        self._roi_runs = 0
+        self._full_runs = 0
+
+    def check(self, session, frame):
+        """Compare a frame with the session's last processed frame.
+
+        Returns (thumb, cached, roi). ``cached`` is the previous Detections
+        when nothing changed meaningfully, otherwise None. ``roi`` is the
+        (x1, y1, x2, y2) pixel region worth re-running when ROI inference is
+        on and the change is local, otherwise None. Pass ``thumb`` back to
+        store() after running the model.
+        """
+        thumb = cv2.GaussianBlur(cv2.cvtColor(cv2.resize(frame, THUMB_SIZE, interpolation=cv2.INTER_AREA),
+                                              cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        with self._lock:
+            state = self._sessions.get(session)
+            if state is not None:
+                self._sessions.move_to_end(session)
+        if state is None:
+            return thumb, None, None
+
+        changed = cv2.absdiff(thumb, state.thumb) > PIXEL_DIFF
+        if np.count_nonzero(changed) < self.min_changed * changed.size and state.reused < self.max_reuse:
+            with self._lock:
+                state.reused += 1
+                self._reused += 1
+            return thumb, state.result, None
+
+        roi = changed_region(changed, frame.shape) if self.roi_enabled else None
+        return thumb, None, roi
+
+    def store(self, session, thumb, result, roi=None):
+        """Remember the detections the model produced for a session's frame."""
+        with self._lock:
+            self._sessions[session] = _SessionState(thumb, result)
+            self._sessions.move_to_end(session)
+            while len(self._sessions) > MAX_SESSIONS:
+                self._sessions.popitem(last=False)
+            if roi is None:
+                self._full_runs += 1
+            else:
+                self._roi_runs += 1
+
+    def previous(self, session):
+        """Return the session's last stored Detections, or None."""
+        with self._lock:
+            state = self._sessions.get(session)
+        return state.result if state is not None else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'reused_frames': self._reused,
+                'roi_runs': self._roi_runs,
+                'full_runs': self._full_runs,
+            }
+
+
+def changed_region(changed, frame_shape):
+    """Bounding box of the changed thumbnail pixels, scaled to the frame and padded.
+
+    Returns None when nothing changed or the region is too large to be worth cropping.
+    """
+    ys, xs = np.nonzero(changed)
+    if not len(xs):
+        return None
+    h, w = frame_shape[:2]
+    sx, sy = w / changed.shape[1], h / changed.shape[0]
+    mx, my = ROI_MARGIN * w, ROI_MARGIN * h
+    x1 = int(max(0, xs.min() * sx - mx))
+    y1 = int(max(0, ys.min() * sy - my))
+    x2 = int(min(w, (xs.max() + 1) * sx + mx))
+    y2 = int(min(h, (ys.max() + 1) * sy + my))
+    if (x2 - x1) * (y2 - y1) > ROI_MAX_AREA * w * h:
+        return None
+    return x1, y1, x2, y2
+
+
+def merge_roi(previous, roi_result, roi):
+    """Combine detections from a cropped region with the previous detections outside it."""
+    if previous is None:
+        previous = Detections.empty()
+    x1, y1, x2, y2 = roi
+    shifted = roi_result.xyxy + np.array([x1, y1, x1, y1], dtype=roi_result.xyxy.dtype)
+
+    # Keep old boxes that don't touch the re-examined region at all
+    old = previous.xyxy
+    outside = (old[:, 2] <= x1) | (old[:, 0] >= x2) | (old[:, 3] <= y1) | (old[:, 1] >= y2)
+    return Detections(
+        np.concatenate([old[outside], shifted]),
+        np.concatenate([previous.conf[outside], roi_result.conf]),
+        np.concatenate([previous.cls[outside], roi_result.cls]),
+    )
@@ -0,0 +1,129 @@
+"""
+Keyset pagination and incremental date grouping for the log pages.
+
+Instead of OFFSET (which still walks every skipped row) each page remembers
+the sort key of its last row in an opaque cursor, and the next page asks for
+rows strictly after it. Every ordering ends in the log row id so the key is
+unique. Rows are grouped by day while they stream into the template, so a
+page never has to be held in memory as a whole.
+"""
+
+import base64
+import datetime
+import functools
+import itertools
+import json
+import os
+
+LOG_PAGE_SIZE = int(os.environ.get('LABCV_LOG_PAGE_SIZE', '100'))
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """Return the key values stored in a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+
+def after_condition(order, values):
+    """SQL condition selecting rows that sort after ``values`` in ``order``.
+
+    ``order`` is a list of (expression, 'ASC' | 'DESC'). When every column
+    sorts the same way this is a row-value comparison, (a, b) < (?, ?),
+    which SQLite answers with an index range search. Mixed directions are
+    expanded to (a > ?) OR (a = ? AND b < ?) OR ..., behind a leading
+    a >= ? bound so the index on the first column still limits the search.
+    """
+    first, direction = order[0]
+    op = '>' if direction == 'ASC' else '<'
+    if all(d == direction for _, d in order):
+        columns = ', '.join(expr for expr, _ in order)
+        marks = ', '.join('?' * len(order))
+        return f"(({columns}) {op} ({marks}))", list(values)
+
+    clauses, params = [], []
+    for i, (expr, direction) in enumerate(order):
+        op = '>' if direction == 'ASC' else '<'
+        terms = [f"{e} = ?" for e, _ in order[:i]] + [f"{expr} {op} ?"]
+        clauses.append('(' + ' AND '.join(terms) + ')')
+        params.extend(values[:i + 1])
+    bound = '>=' if order[0][1] == 'ASC' else '<='
+    return f"({first} {bound} ? AND (" + ' OR '.join(clauses) + '))', [values[0]] + params
+
+
+class LogPage:
+    """One page of a keyset-paginated query.
+
+    ``select`` is a SELECT ... FROM ... [JOIN ...] without WHERE/ORDER BY;
+    ``key_columns`` are the positions in each row of the ``order`` expressions.
+    Iterate ``groups()`` once to stream the rows; ``next_cursor`` is set when
+    another page follows.
+    """
+
+    def __init__(self, cursor, select, where, params, order, key_columns, timestamp_column,
+                 after=None, page_size=None):
+        self.page_size = page_size = page_size or LOG_PAGE_SIZE
+        self.key_columns = key_columns
+        self.timestamp_column = timestamp_column
+        self.next_cursor = None
+        self.count = 0
+
+        where = list(where)
+        params = list(params)
+        values = decode_cursor(after, len(order))
+        if values is not None:
+            condition, condition_params = after_condition(order, values)
+            where.append(condition)
+            params.extend(condition_params)
+        query = select
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY ' + ', '.join(f"{expr} {direction}" for expr, direction in order)
+        query += ' LIMIT ?'
+        # One extra row tells us whether there is a next page
+        cursor.execute(query, params + [page_size + 1])
+        self._cursor = cursor
+
+    def rows(self):
+        for row in self._cursor:
+            if self.count == self.page_size:
+                self.next_cursor = encode_cursor([self._last[i] for i in self.key_columns])
+                break
+            self.count += 1
+            self._last = row
+            yield row
+
+    def groups(self):
+        """Yield (date_display, rows) for each run of rows logged on the same day."""
+        day = lambda row: (row[self.timestamp_column] or '').split(' ')[0]
+        for date_str, rows in itertools.groupby(self.rows(), key=day):
+            yield format_log_date(date_str), rows
+
+    def __bool__(self):
+        # Lets templates test the page before streaming it
+        if not hasattr(self, '_first'):
+            self._first = self._cursor.fetchone()
+            if self._first is not None:
+                self._cursor = itertools.chain([self._first], self._cursor)
+        return self._first is not None
+
+
+@functools.lru_cache(maxsize=512)
+def format_log_date(date_str):
+    """'2024-01-15' -> 'Monday, January 15, 2024' (unparseable dates are shown as-is)."""
+    if not date_str:
+        return 'Unknown'
+    try:
+        return datetime.datetime.strptime(date_str, '%Y-%m-%d').strftime('%A, %B %d, %Y')
+    except ValueError:
+        return date_str
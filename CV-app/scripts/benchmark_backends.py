@@ -0,0 +1,70 @@
+"""
+benchmark_backends.py
+Compares per-frame detection latency of the available inference backends
+on the images in "dataset (trivial)/test".
+
+Usage (from the CV-app folder):
+    python scripts/benchmark_backends.py
+    python scripts/benchmark_backends.py --backends ultralytics onnx --frames 100
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from backends import BACKENDS, load_backend  # noqa: E402
+
+
+def load_frames(image_dir, limit):
+    paths = sorted(glob.glob(os.path.join(image_dir, '*.jpg')))[:limit]
+    return [cv2.imread(p) for p in paths]
+
+
+def benchmark(backend, frames, runs, warmup=3):
+    """Return per-frame latencies in milliseconds for single-frame calls."""
+    for frame in frames[:warmup]:
+        backend([frame])
+
+    latencies = []
+    for i in range(runs):
+        frame = frames[i % len(frames)]
+        start = time.perf_counter()
+        backend([frame])
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weights', default=os.path.join(PROJECT_ROOT, 'capstone.pt'))
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--images', default=os.path.join(PROJECT_ROOT, 'dataset (trivial)', 'test', 'images'))
+    parser.add_argument('--frames', type=int, default=50, help='number of timed frames per backend')
+    parser.add_argument('--imgsz', type=int, default=None)
+    args = parser.parse_args()
+
+    frames = load_frames(args.images, args.frames)
+    if not frames:
+        sys.exit(f"No .jpg images found in {args.images}")
+
+    print(f"{'backend':<12} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'fps':>7}")
+    for name in args.backends:
+        try:
+            backend = load_backend(args.weights, name, imgsz=args.imgsz)
+        except ImportError as e:
+            print(f"{name:<12} skipped ({e})")
+            continue
+        ms = benchmark(backend, frames, args.frames)
+        print(f"{name:<12} {ms.mean():9.1f} {np.percentile(ms, 50):9.1f} {np.percentile(ms, 95):9.1f} {1000.0 / ms.mean():7.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+quantize_model.py
+Builds an INT8 ONNX version of capstone.pt and checks it against the
+original before it is rolled out to the lab laptops.
+
+1. Exports capstone.pt to ONNX (cached as capstone.onnx).
+2. Quantizes it to INT8 (capstone.int8.onnx). Static quantization is
+   calibrated on images from "dataset (trivial)/train"; --mode dynamic
+   quantizes weights only and needs no calibration.
+3. Evaluates the original and the INT8 model on "dataset (trivial)/valid":
+   per-class AP50 and AP50-95 plus mean per-frame latency.
+
+Usage (from the CV-app folder):
+    python scripts/quantize_model.py
+    python scripts/quantize_model.py --mode dynamic --report int8_report.txt
+    python scripts/quantize_model.py --skip-quantize   # only re-run the evaluation
+
+Run the app on the quantized model through the normal backend code path:
+    LABCV_BACKEND=onnx LABCV_MODEL=capstone.int8.onnx python app.py
+"""
+
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+
+import cv2
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from backends import IMGSZ, box_iou, export_model, load_backend, preprocess  # noqa: E402
+
+DATASET_DIR = os.path.join(PROJECT_ROOT, 'dataset (trivial)')
+# Class order of the label files in the bundled dataset (see data.yaml)
+DATASET_CLASSES = ['beaker', 'erlenmeyer_flask', 'funnel', 'graduated_cylinder']
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+# ---------- Quantization ----------
+class CalibrationReader:
+    """Feeds letterboxed training images to the ONNX Runtime calibrator."""
+
+    def __init__(self, image_paths, input_name, imgsz):
+        self.image_paths = iter(image_paths)
+        self.input_name = input_name
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for path in self.image_paths:
+            frame = cv2.imread(path)
+            if frame is not None:
+                return {self.input_name: preprocess([frame], self.imgsz)[0]}
+        return None
+
+
+def quantize(onnx_path, output_path, mode, calibration_images, imgsz):
+    import onnx
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    prepared_path = onnx_path.replace('.onnx', '.prep.onnx')
+    quant_pre_process(onnx_path, prepared_path)
+
+    if mode == 'dynamic':
+        quantize_dynamic(prepared_path, output_path, weight_type=QuantType.QInt8)
+    else:
+        input_name = ort.InferenceSession(prepared_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+        quantize_static(
+            prepared_path, output_path,
+            CalibrationReader(calibration_images, input_name, imgsz),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+    os.remove(prepared_path)
+
+    # Keep the class names and other export metadata the backend reads
+    original = onnx.load(onnx_path, load_external_data=False)
+    quantized = onnx.load(output_path)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(original.metadata_props)
+    onnx.save(quantized, output_path)
+
+
+# ---------- Evaluation ----------
+def load_labels(label_path, width, height):
+    """Read a YOLO label file into (classes, xyxy pixel boxes)."""
+    rows = np.loadtxt(label_path, ndmin=2) if os.path.getsize(label_path) else np.zeros((0, 5))
+    cls = rows[:, 0].astype(int)
+    cx, cy, bw, bh = rows[:, 1] * width, rows[:, 2] * height, rows[:, 3] * width, rows[:, 4] * height
+    return cls, np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+
+
+def average_precision(tp, conf, n_gt):
+    """COCO-style 101-point interpolated AP for one class at one IoU threshold."""
+    if n_gt == 0 or len(tp) == 0:
+        return 0.0
+    order = np.argsort(-conf)
+    tp = tp[order]
+    tpc, fpc = np.cumsum(tp), np.cumsum(1 - tp)
+    recall = tpc / n_gt
+    precision = tpc / (tpc + fpc)
+    precision = np.flip(np.maximum.accumulate(np.flip(precision)))
+    points = np.linspace(0, 1, 101)
+    idx = np.searchsorted(recall, points, side='left')
+    return float(np.mean([precision[i] if i < len(precision) else 0.0 for i in idx]))
+
+
+def evaluate(backend, split_dir):
+    """Return ({class: (AP50, AP50-95)}, mean latency ms) of a backend on a dataset split."""
+    name_to_id = {name: i for i, name in enumerate(DATASET_CLASSES)}
+    model_to_dataset = {k: name_to_id.get(v) for k, v in backend.names.items()}
+
+    matches = {c: [] for c in range(len(DATASET_CLASSES))}  # per class: (conf, tp per IoU threshold)
+    n_gt = np.zeros(len(DATASET_CLASSES), int)
+    latencies = []
+
+    for image_path in sorted(glob.glob(os.path.join(split_dir, 'images', '*.jpg'))):
+        label_path = os.path.join(split_dir, 'labels', os.path.splitext(os.path.basename(image_path))[0] + '.txt')
+        frame = cv2.imread(image_path)
+        h, w = frame.shape[:2]
+        gt_cls, gt_xyxy = load_labels(label_path, w, h) if os.path.exists(label_path) else (np.zeros(0, int), np.zeros((0, 4)))
+        n_gt += np.bincount(gt_cls, minlength=len(DATASET_CLASSES))
+
+        start = time.perf_counter()
+        det = backend([frame])[0]
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+        # Greedy matching, highest confidence first, separately per IoU threshold
+        taken = np.zeros((len(IOU_THRESHOLDS), len(gt_cls)), bool)
+        for i in np.argsort(-det.conf):
+            c = model_to_dataset.get(int(det.cls[i]))
+            if c is None:
+                continue
+            tp = np.zeros(len(IOU_THRESHOLDS))
+            same = np.flatnonzero(gt_cls == c)
+            if len(same):
+                ious = box_iou(det.xyxy[i], gt_xyxy[same])
+                for t, thr in enumerate(IOU_THRESHOLDS):
+                    free = (ious >= thr) & ~taken[t, same]
+                    if free.any():
+                        taken[t, same[np.argmax(np.where(free, ious, -1))]] = True
+                        tp[t] = 1
+            matches[c].append((float(det.conf[i]), tp))
+
+    per_class = {}
+    for c, name in enumerate(DATASET_CLASSES):
+        conf = np.array([m[0] for m in matches[c]])
+        tps = np.array([m[1] for m in matches[c]]).reshape(-1, len(IOU_THRESHOLDS))
+        aps = [average_precision(tps[:, t], conf, n_gt[c]) for t in range(len(IOU_THRESHOLDS))]
+        per_class[name] = (aps[0], float(np.mean(aps)))
+    return per_class, float(np.mean(latencies))
+
+
+def format_report(rows):
+    """rows: list of (label, per_class, latency_ms). The first row is the baseline."""
+    lines = [f"{'model':<22} {'class':<20} {'AP50':>7} {'AP50-95':>8}"]
+    for label, per_class, _ in rows:
+        for name, (ap50, ap) in per_class.items():
+            lines.append(f"{label:<22} {name:<20} {ap50:7.3f} {ap:8.3f}")
+        map50 = np.mean([v[0] for v in per_class.values()])
+        mapall = np.mean([v[1] for v in per_class.values()])
+        lines.append(f"{label:<22} {'all (mAP)':<20} {map50:7.3f} {mapall:8.3f}")
+    lines.append('')
+
+    base_label, base_classes, base_ms = rows[0]
+    base_map = np.mean([v[1] for v in base_classes.values()])
+    lines.append(f"{'model':<22} {'latency ms':>10} {'speedup':>8} {'mAP50-95 drop':>14}")
+    for label, per_class, ms in rows:
+        mapall = np.mean([v[1] for v in per_class.values()])
+        lines.append(f"{label:<22} {ms:10.1f} {base_ms / ms:7.2f}x {base_map - mapall:14.3f}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weights', default=os.path.join(PROJECT_ROOT, 'capstone.pt'))
+    parser.add_argument('--mode', choices=('static', 'dynamic'), default='static')
+    parser.add_argument('--calibration-images', type=int, default=200,
+                        help='number of random train images used to calibrate static quantization')
+    parser.add_argument('--imgsz', type=int, default=IMGSZ)
+    parser.add_argument('--skip-quantize', action='store_true', help='reuse an existing capstone.int8.onnx')
+    parser.add_argument('--report', help='also write the report to this file')
+    args = parser.parse_args()
+
+    onnx_path = export_model(args.weights, 'onnx', args.imgsz)
+    int8_path = os.path.splitext(args.weights)[0] + '.int8.onnx'
+
+    if not args.skip_quantize:
+        train_images = sorted(glob.glob(os.path.join(DATASET_DIR, 'train', 'images', '*.jpg')))
+        random.Random(0).shuffle(train_images)
+        print(f"Quantizing ({args.mode}) -> {int8_path}")
+        quantize(onnx_path, int8_path, args.mode, train_images[:args.calibration_images], args.imgsz)
+
+    valid_dir = os.path.join(DATASET_DIR, 'valid')
+    rows = []
+    for label, path, backend_name in (
+        ('pytorch fp32', args.weights, 'ultralytics'),
+        ('onnx fp32', onnx_path, 'onnx'),
+        (f'onnx int8 ({args.mode})', int8_path, 'onnx'),
+    ):
+        backend = load_backend(path, backend_name, imgsz=args.imgsz)
+        backend.conf_threshold = 0.001  # score every candidate box, as mAP evaluation expects
+        print(f"Evaluating {label} on {valid_dir} ...")
+        per_class, ms = evaluate(backend, valid_dir)
+        rows.append((label, per_class, ms))
+
+    report = format_report(rows)
+    print()
+    print(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
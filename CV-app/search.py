@@ -0,0 +1,94 @@
+"""
+Student lookup by name, ID or course.
+
+Searches go through the ``students_fts`` FTS5 index (see migrations.py), so
+typing "mar san" finds "Maria Santos" without scanning the students table.
+Every word of the query is matched as a prefix. When the index doesn't exist
+(SQLite built without FTS5) the same functions fall back to LIKE.
+"""
+
+import re
+
+from db import get_db
+
+SUGGESTION_LIMIT = 10
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_query(text, column=None):
+    """Turn what staff typed into an FTS5 query: every word, as a prefix.
+
+    With ``column`` the words must all occur in that column. Returns None
+    when there is nothing searchable in the text.
+    """
+    words = _WORD.findall(text or '')
+    if not words:
+        return None
+    prefix = f'{column} : ' if column else ''
+    return ' '.join(f'{prefix}"{word}"*' for word in words)
+
+
+def has_index(c):
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='students_fts'")
+    return c.fetchone() is not None
+
+
+def name_filter(c, text, column='el.student_id'):
+    """SQL condition and params restricting ``column`` to students whose name matches ``text``.
+
+    The FTS index is searched first, and only the matching student IDs reach
+    the outer query.
+    """
+    query = fts_query(text, column='name')
+    if query is not None and has_index(c):
+        return (f"{column} IN (SELECT student_id FROM students_fts WHERE students_fts MATCH ?)", [query])
+    return (f"{column} IN (SELECT student_id FROM students WHERE name LIKE ?)", [f'%{text}%'])
+
+
+def suggest(c, text, limit=SUGGESTION_LIMIT):
+    """Return up to ``limit`` (student_id, name, course) rows matching what was typed, best first."""
+    query = fts_query(text)
+    if query is None:
+        return []
+    if has_index(c):
+        c.execute("""
+            SELECT s.student_id, s.name, s.course
+            FROM students_fts
+            JOIN students s ON s.student_id = students_fts.student_id
+            WHERE students_fts MATCH ?
+            ORDER BY bm25(students_fts, 5.0, 10.0, 1.0)
+            LIMIT ?
+        """, (query, limit))
+    else:
+        like = f'%{text.strip()}%'
+        c.execute("""
+            SELECT student_id, name, course FROM students
+            WHERE name LIKE ? OR student_id LIKE ? OR course LIKE ?
+            ORDER BY name
+            LIMIT ?
+        """, (like, like, like, limit))
+    return c.fetchall()
+
+
+def rebuild_index(conn=None):
+    """Rewrite students_fts from the students table. Returns the number of students indexed."""
+    conn = conn or get_db()
+    c = conn.cursor()
+    if not has_index(c):
+        return None
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("DELETE FROM students_fts")
+        c.execute("DELETE FROM students_search_keys WHERE student_id NOT IN (SELECT student_id FROM students)")
+        c.execute("INSERT OR IGNORE INTO students_search_keys (student_id) SELECT student_id FROM students")
+        count = c.execute("""
+            INSERT INTO students_fts (rowid, name, student_id, course)
+            SELECT k.id, s.name, s.student_id, s.course
+            FROM students s JOIN students_search_keys k ON k.student_id = s.student_id
+        """).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
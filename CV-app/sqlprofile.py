@@ -0,0 +1,245 @@
+"""
+Opt-in SQL profiler and slow-query log.
+
+With LABCV_SQL_PROFILE=1, db.connect() opens ProfilingConnections: every
+statement is timed from execute() until its cursor is done with it (the
+next execute, close, or once the response has been sent, which for streamed
+pages is after their rows were fetched), including the time spent fetching
+its rows, and the rows returned (SELECT) or changed (DML) are
+counted. Statements are aggregated by their SQL text, so one entry covers
+every call with different parameters.
+
+A statement slower than LABCV_SLOW_QUERY_MS is also written, with its
+parameters and EXPLAIN QUERY PLAN, to a rotating log (LABCV_SLOW_QUERY_LOG,
+default logs/slow_queries.log next to the app). /admin_queries lists the
+top offenders. Profiling is off by default: it adds a Python call per row.
+"""
+
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+
+ENABLED = os.environ.get('LABCV_SQL_PROFILE', '0').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_MS = float(os.environ.get('LABCV_SLOW_QUERY_MS', '100'))
+SLOW_QUERY_LOG = os.environ.get('LABCV_SLOW_QUERY_LOG') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'logs', 'slow_queries.log')
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 5
+MAX_STATEMENTS = 500
+
+_WHITESPACE = re.compile(r'\s+')
+# Only these can be explained; BEGIN/COMMIT/PRAGMA and friends can't
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class StatementStats:
+    __slots__ = ('sql', 'calls', 'total', 'max', 'rows', 'slow', 'plan')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.plan = None
+
+    @property
+    def mean(self):
+        return self.total / self.calls if self.calls else 0.0
+
+
+class Profiler:
+    """Per-statement totals for the whole process, plus each thread's running DB time."""
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, log_path=SLOW_QUERY_LOG):
+        self.slow_seconds = slow_ms / 1000.0
+        self.log_path = log_path
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._log = None
+
+    def record(self, conn, sql, params, seconds, rows):
+        key = _WHITESPACE.sub(' ', sql).strip()
+        slow = seconds >= self.slow_seconds
+        self._local.db_seconds = getattr(self._local, 'db_seconds', 0.0) + seconds
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= MAX_STATEMENTS:
+                    return
+                stats = self._stats[key] = StatementStats(key)
+            stats.calls += 1
+            stats.total += seconds
+            stats.max = max(stats.max, seconds)
+            stats.rows += rows
+            need_plan = slow and stats.plan is None
+            if slow:
+                stats.slow += 1
+        if slow:
+            plan = explain(conn, sql, params) if need_plan else stats.plan
+            if need_plan:
+                stats.plan = plan
+            self._write_slow(key, params, seconds, rows, plan)
+
+    def take_thread_seconds(self):
+        """Return and reset the DB time spent by the current thread (e.g. during one request)."""
+        seconds = getattr(self._local, 'db_seconds', 0.0)
+        self._local.db_seconds = 0.0
+        return seconds
+
+    def top(self, sort='total', limit=50):
+        """The worst statements by ``sort`` ('total', 'max', 'mean', 'calls', 'rows' or 'slow')."""
+        with self._lock:
+            stats = list(self._stats.values())
+        return sorted(stats, key=lambda s: getattr(s, sort), reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def _write_slow(self, sql, params, seconds, rows, plan):
+        if self._log is None:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(self.log_path, maxBytes=LOG_MAX_BYTES,
+                                                           backupCount=LOG_BACKUPS, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            log = logging.getLogger('labcv.slow_queries')
+            log.setLevel(logging.INFO)
+            log.propagate = False
+            log.addHandler(handler)
+            self._log = log
+        plan_text = '\n'.join(f'    {line}' for line in (plan or ['(no plan)']))
+        self._log.info("%.1f ms, %d row(s): %s\n    params: %r\n%s", seconds * 1000.0, rows, sql, params, plan_text)
+
+
+def explain(conn, sql, params):
+    """Return the EXPLAIN QUERY PLAN of ``sql`` as indented lines, or None if it can't be explained."""
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    try:
+        # A plain cursor, so explaining doesn't get profiled itself
+        rows = sqlite3.Cursor(conn).execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    except sqlite3.Error as e:
+        return [f'(no plan: {e})']
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return lines
+
+
+profiler = Profiler()
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Cursor that reports each statement to the profiler once it is done with it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._statement = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        return self._start(sql, parameters, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        seq_of_parameters = list(seq_of_parameters)
+        return self._start(sql, seq_of_parameters[0] if seq_of_parameters else (),
+                           super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        self._finish()
+        return super().executescript(sql_script)
+
+    def _start(self, sql, params, run, *args):
+        started = time.perf_counter()
+        try:
+            run(*args)
+        finally:
+            # [sql, params, seconds so far, rows fetched]
+            self._statement = [sql, params, time.perf_counter() - started, 0]
+            _open_cursors().add(self)
+        return self
+
+    def _timed(self, fetch, *args):
+        started = time.perf_counter()
+        rows = fetch(*args)
+        if self._statement is not None:
+            self._statement[2] += time.perf_counter() - started
+            self._statement[3] += len(rows) if isinstance(rows, list) else rows is not None
+        return rows
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def __next__(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # conn.execute(...).fetchall() drops its cursor right away
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        if statement is None:
+            return
+        _open_cursors().discard(self)
+        sql, params, seconds, rows = statement
+        if self.rowcount > 0 and not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            rows = self.rowcount
+        profiler.record(self.connection, sql, params, seconds, rows)
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """Connection whose cursors (including the execute() shortcuts) are ProfilingCursors."""
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+_threads = threading.local()
+
+
+def _open_cursors():
+    cursors = getattr(_threads, 'cursors', None)
+    if cursors is None:
+        cursors = _threads.cursors = weakref.WeakSet()
+    return cursors
+
+
+def flush():
+    """Report the statements this thread's cursors are still holding (call once a response has been sent)."""
+    for cursor in list(_open_cursors()):
+        cursor._finish()
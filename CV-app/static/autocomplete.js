@@ -0,0 +1,55 @@
+// Student autocomplete for inputs marked with data-student-autocomplete.
+// Suggestions come from /student_suggestions and fill a <datalist>. The value
+// put in the field is the student ID, or the name when the input's
+// data-autocomplete-field (or the select it names) says "name".
+(function () {
+    function fieldFor(input) {
+        const source = input.dataset.autocompleteFieldFrom;
+        if (source) {
+            const select = document.getElementById(source);
+            return select && select.value === 'name' ? 'name' : 'student_id';
+        }
+        return input.dataset.autocompleteField || 'student_id';
+    }
+
+    function attach(input) {
+        const list = document.createElement('datalist');
+        list.id = input.id + '-suggestions';
+        input.setAttribute('list', list.id);
+        input.setAttribute('autocomplete', 'off');
+        input.after(list);
+
+        let timer = null;
+        let controller = null;
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            const q = input.value.trim();
+            if (!q) {
+                list.innerHTML = '';
+                return;
+            }
+            timer = setTimeout(function () {
+                // Only the latest keystroke's request matters
+                if (controller) controller.abort();
+                controller = new AbortController();
+                fetch('/student_suggestions?q=' + encodeURIComponent(q), { signal: controller.signal })
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) {
+                        const field = fieldFor(input);
+                        list.innerHTML = '';
+                        data.students.forEach(function (student) {
+                            const option = document.createElement('option');
+                            option.value = student[field];
+                            option.label = field === 'name'
+                                ? student.student_id
+                                : student.name + (student.course ? ' — ' + student.course : '');
+                            list.appendChild(option);
+                        });
+                    })
+                    .catch(function () { /* aborted or offline: keep typing */ });
+            }, 150);
+        });
+    }
+
+    document.querySelectorAll('input[data-student-autocomplete]').forEach(attach);
+})();
@@ -30,6 +30,8 @@ except ImportError:
     sys.modules['ultralytics'] = type(sys)('ultralytics')
     sys.modules['ultralytics'].YOLO = MockYOLO
 
+import app as app_module
+from backends import Detections
 from app import app
 
 
@@ -47,6 +49,17 @@ def get_db():
     return sqlite3.connect(DB_PATH)
 
 
+@pytest.fixture
+def migrated_db(tmp_path, monkeypatch):
+    """Point the app at a fresh, fully migrated database file."""
+    import db
+    from migrations import migrate
+    monkeypatch.setattr(db, 'DB_PATH', str(tmp_path / 'labcv.db'))
+    migrate()
+    yield db.get_db()
+    db.close()
+
+
 def setup_test_students():
     """Add test students if not present."""
     conn = get_db()
@@ -350,5 +363,935 @@ class TestInputValidation:
         assert b"Quantity" in response.data or b"at least 1" in response.data
 
 
+class FakeModel:
+    """Stand-in for the YOLO model that records calls and detects nothing."""
+    names = {}
+
+    def __init__(self):
+        self.frames = []
+        self.batches = []
+
+    def __call__(self, frames, **kwargs):
+        self.frames.extend(frames)
+        self.batches.append(len(frames))
+        return [Detections.empty() for _ in frames]
+
+
+def encode_test_jpeg():
+    """Return JPEG bytes of a small blank frame."""
+    import cv2
+    import numpy as np
+    ok, buf = cv2.imencode('.jpg', np.zeros((48, 64, 3), np.uint8))
+    assert ok
+    return buf.tobytes()
+
+
+class TestFrameTransport:
+    """Test the binary and legacy frame uploads on /process_frame."""
+
+    def test_raw_jpeg_body(self, client, migrated_db, monkeypatch):
+        fake = FakeModel()
+        monkeypatch.setattr(app_module.model_loader, 'model', fake)
+
+        response = client.post('/process_frame', data=encode_test_jpeg(),
+                               content_type='image/jpeg')
+
+        assert response.status_code == 200
+        assert fake.frames[0].shape == (48, 64, 3)
+
+    def test_legacy_base64_form_field(self, client, migrated_db, monkeypatch):
+        import base64
+        fake = FakeModel()
+        monkeypatch.setattr(app_module.model_loader, 'model', fake)
+
+        data_url = 'data:image/jpeg;base64,' + base64.b64encode(encode_test_jpeg()).decode()
+        response = client.post('/process_frame', data={'image_data': data_url})
+
+        assert response.status_code == 200
+        assert fake.frames[0].shape == (48, 64, 3)
+
+    def test_empty_body_rejected(self, client, migrated_db, monkeypatch):
+        monkeypatch.setattr(app_module.model_loader, 'model', FakeModel())
+        response = client.post('/process_frame', data=b'', content_type='image/jpeg')
+        assert response.status_code == 400
+
+
+class TestCaptureJobs:
+    """Test the background capture jobs behind /process_capture."""
+
+    def test_json_capture_returns_job_and_result(self, client, migrated_db, monkeypatch):
+        fake = FakeModel()
+        monkeypatch.setattr(app_module.model_loader, 'model', fake)
+
+        response = client.post('/process_capture', data=encode_test_jpeg(), content_type='image/jpeg',
+                               headers={'Accept': 'application/json'})
+        assert response.status_code == 202
+        job_id = response.get_json()['job_id']
+        assert app_module.capture_jobs.get(job_id).done.wait(5)
+
+        data = client.get(f'/capture_jobs/{job_id}').get_json()
+        assert data['status'] == 'done' and data['counts'] == {}
+        assert fake.frames[0].shape == (48, 64, 3)
+
+    def test_form_capture_redirects_to_borrow_page(self, client, migrated_db, monkeypatch):
+        monkeypatch.setattr(app_module.model_loader, 'model', FakeModel())
+
+        response = client.post('/process_capture', data=encode_test_jpeg(), content_type='image/jpeg')
+
+        assert response.status_code == 302
+        assert '/borrow_return?job=' in response.headers['Location']
+
+    def test_malformed_base64_capture_rejected(self, client, migrated_db, monkeypatch):
+        monkeypatch.setattr(app_module.model_loader, 'model', FakeModel())
+        data = {'image_data': 'data:image/jpeg;base64,abc'}
+
+        response = client.post('/process_capture', data=data, headers={'Accept': 'application/json'})
+        assert response.status_code == 400 and 'error' in response.get_json()
+
+        response = client.post('/process_capture', data=data)
+        assert response.status_code == 302 and response.headers['Location'].endswith('/borrow_return')
+
+    def test_failed_and_expired_jobs(self):
+        from concurrent.futures import Future
+        from jobs import JobStore
+        store = JobStore(ttl=60)
+        future = Future()
+        job = store.submit(future, lambda result: {'counts': result})
+        assert store.get(job.id).to_dict()['status'] == 'pending'
+        future.set_exception(RuntimeError('model crashed'))
+        assert store.get(job.id).to_dict() == {'job_id': job.id, 'status': 'failed', 'error': 'model crashed'}
+
+        store.ttl = 0
+        assert store.get(job.id) is None
+        assert store.stats()['expired'] == 1
+
+    def test_unknown_job(self, client, migrated_db):
+        assert client.get('/capture_jobs/nope').status_code == 404
+
+
+class TestRequestMetrics:
+    """Test per-stage timings, Server-Timing and /metrics."""
+
+    def test_frame_stages_in_server_timing_and_metrics(self, client, migrated_db, monkeypatch):
+        from metrics import Registry
+        monkeypatch.setattr(app_module.model_loader, 'model', FakeModel())
+        monkeypatch.setattr(app_module, 'request_metrics', Registry())
+
+        response = client.post('/process_frame', data=encode_test_jpeg(), content_type='image/jpeg')
+        stages = [part.split(';')[0] for part in response.headers['Server-Timing'].split(', ')]
+        assert stages == ['read', 'decode', 'queue', 'model', 'inventory', 'postprocess', 'json', 'total']
+
+        text = client.get('/metrics').get_data(as_text=True)
+        assert 'labcv_requests_total{endpoint="process_frame",method="POST",status="200"} 1' in text
+        assert 'labcv_stage_duration_seconds_count{endpoint="process_frame",stage="model"} 1' in text
+        assert 'labcv_request_duration_seconds{endpoint="process_frame",quantile="0.99"}' in text
+
+    def test_streamed_page_recorded_after_its_body(self, client, migrated_db, monkeypatch):
+        from metrics import Registry
+        registry = Registry()
+        monkeypatch.setattr(app_module, 'request_metrics', registry)
+
+        response = client.get('/history', buffered=False)
+        assert response.is_streamed and 'Server-Timing' in response.headers
+        assert 'history' not in registry.snapshot()
+
+        response.get_data()
+        response.close()
+        assert registry.snapshot()['history']['count'] == 1
+
+    def test_backend_stages_reported_separately(self, client, migrated_db, monkeypatch):
+        stages = {'preprocess': 0.001, 'inference': 0.004, 'postprocess': 0.002}
+
+        class StagedModel(FakeModel):
+            def __call__(self, frames, **kwargs):
+                return [Detections(d.xyxy, d.conf, d.cls, stages) for d in super().__call__(frames)]
+
+        monkeypatch.setattr(app_module.model_loader, 'model', StagedModel())
+        response = client.post('/process_frame', data=encode_test_jpeg(), content_type='image/jpeg')
+        timing = response.headers['Server-Timing']
+        assert 'model;dur=' in timing and 'model_preprocess;dur=1.0' in timing
+        assert 'model_inference;dur=4.0' in timing and 'model_postprocess;dur=2.0' in timing
+
+    def test_errors_and_quantiles(self):
+        from metrics import Registry
+        registry = Registry(window=100)
+        for ms in range(1, 101):
+            registry.observe_request('records', 'GET', 200, ms / 1000.0, [('db', ms / 2000.0)])
+        registry.observe_request('records', 'GET', 500, 0.001)
+
+        records = registry.snapshot()['records']
+        assert records['count'] == 101 and records['errors'] == 1
+        assert 0.094 < records['p95'] < 0.097
+        assert records['stages']['db']['count'] == 100
+        assert 'labcv_request_errors_total{endpoint="records"} 1' in registry.render()
+
+
+class TestInferenceScheduler:
+    """Test micro-batching of concurrent frames."""
+
+    def test_concurrent_frames_share_a_batch(self):
+        from inference import InferenceScheduler
+        fake = FakeModel()
+        scheduler = InferenceScheduler(fake, window_ms=200, max_batch=4)
+
+        futures = [scheduler.submit(i) for i in range(4)]
+        results = [f.result(timeout=5) for f in futures]
+
+        assert len(results) == 4
+        assert fake.batches == [4]
+        assert scheduler.stats()['avg_batch_size'] == 4
+
+    def test_model_error_reaches_every_caller(self):
+        from inference import InferenceScheduler
+
+        def broken(frames):
+            raise ValueError("boom")
+
+        scheduler = InferenceScheduler(broken, window_ms=1)
+        with pytest.raises(ValueError):
+            scheduler.infer('frame', timeout=5)
+
+    def test_newer_frame_supersedes_queued_one(self):
+        import threading
+        from inference import InferenceScheduler, FrameSuperseded
+        release = threading.Event()
+        fake = FakeModel()
+
+        def slow(frames):
+            release.wait(5)
+            return fake(frames)
+
+        scheduler = InferenceScheduler(slow, window_ms=1, max_batch=1)
+        first = scheduler.submit('busy')           # occupies the worker
+        stale = scheduler.submit('old', session='kiosk-1')
+        fresh = scheduler.submit('new', session='kiosk-1')
+        release.set()
+
+        with pytest.raises(FrameSuperseded):
+            stale.result(timeout=5)
+        fresh.result(timeout=5)
+        first.result(timeout=5)
+        assert fake.frames == ['busy', 'new']
+        assert scheduler.stats()['superseded'] == 1
+
+
+class TestModelWarmup:
+    """Test that pages work while the detection model is still loading."""
+
+    def test_process_frame_reports_warming_up(self, client, migrated_db, monkeypatch):
+        import threading
+        from inference import ModelLoader
+        release = threading.Event()
+        loader = ModelLoader(lambda: release.wait(5) and FakeModel())
+        monkeypatch.setattr(app_module, 'model_loader', loader)
+
+        response = client.post('/process_frame', data=encode_test_jpeg(), content_type='image/jpeg')
+        assert response.status_code == 503
+        assert response.get_json()['warming_up'] is True
+        assert client.get('/health').get_json()['model'] == 'loading'
+
+        release.set()
+        assert loader.wait(5)
+        assert client.get('/health').get_json()['model'] == 'ready'
+
+    def test_warm_up_runs_dummy_frames_at_input_size(self):
+        from backends import warm_up
+        fake = FakeModel()
+        fake.imgsz = 320
+
+        warm_up(fake, runs=2)
+
+        assert fake.batches == [1, 1]
+        assert fake.frames[0].shape == (320, 320, 3)
+
+
+class EchoBackend:
+    """Picklable stand-in backend for the inference worker process."""
+
+    name = 'echo'
+    imgsz = None
+    names = {0: 'beaker'}
+
+    def __call__(self, frames):
+        import numpy as np
+        if any(frame.shape[0] == 13 for frame in frames):
+            raise ValueError('unlucky frame')
+        return [Detections(np.array([[0, 0, f.shape[1], f.shape[0]]], np.float32), np.array([0.9], np.float32), np.array([0]))
+                for f in frames]
+
+
+class TestInferenceWorker:
+    """Test running the model in a separate process."""
+
+    def test_worker_process_runs_batches_and_restarts(self):
+        import os
+        import numpy as np
+        from worker import WorkerModel, WorkerError
+
+        worker = WorkerModel(EchoBackend)
+        try:
+            assert worker.names == {0: 'beaker'} and worker.pid != os.getpid()
+            results = worker([np.zeros((4, 6, 3), np.uint8), np.zeros((8, 2, 3), np.uint8)])
+            assert [r.xyxy.tolist() for r in results] == [[[0, 0, 6, 4]], [[0, 0, 2, 8]]]
+
+            with pytest.raises(WorkerError, match='unlucky frame'):
+                worker([np.zeros((13, 13, 3), np.uint8)])
+
+            worker._process.kill()
+            worker._process.join()
+            assert len(worker([np.zeros((4, 4, 3), np.uint8)])) == 1
+            assert worker.restarts == 1
+        finally:
+            worker.close()
+
+    def test_spawned_worker_runs_worker_module_as_main(self):
+        import sys
+        from worker import _child_main
+
+        main = sys.modules['__main__']
+        spec = main.__spec__
+        with _child_main('worker'):
+            assert main.__spec__.name == 'worker'
+        assert main.__spec__ is spec
+
+
+class TestFrameRing:
+    """Test handing decoded frames to the worker through shared memory."""
+
+    def test_importing_app_allocates_no_ring(self, monkeypatch):
+        # Only the server entry point (start_inference) creates one
+        assert app_module.frame_ring is None
+
+        monkeypatch.setattr(app_module, 'INFERENCE_WORKER', False)
+        monkeypatch.setattr(app_module, 'model_loader', app_module.ModelLoader(lambda: None))
+        app_module.start_inference()
+        assert app_module.frame_ring is None
+
+    def test_decoded_frame_lives_in_a_slot(self):
+        from framering import FrameRing, RingReader
+        ring = FrameRing(slots=2, max_width=640, max_height=480)
+        reader = RingReader(ring.name)
+        try:
+            with ring.decode(encode_test_jpeg()) as frame:
+                assert ring.stats()['in_use'] == 1
+                crop = frame[10:50, 20:90]
+                for view in (frame, crop):
+                    descriptor = ring.describe(view)
+                    assert descriptor is not None
+                    assert (reader.frame(descriptor) == view).all()
+            assert ring.stats()['in_use'] == 0
+            assert ring.describe(crop.copy()) is None
+        finally:
+            reader.shm.close()
+            ring.close()
+
+    def test_full_ring_rejects_frames(self):
+        from framering import FrameRing, RingFull
+        ring = FrameRing(slots=1, max_width=640, max_height=480)
+        try:
+            slot = ring.acquire()
+            with pytest.raises(RingFull):
+                with ring.decode(encode_test_jpeg(), timeout=0.01):
+                    pass
+            ring.release(slot)
+            with ring.decode(encode_test_jpeg()) as frame:
+                assert frame is not None
+            assert ring.stats()['rejected'] == 1
+        finally:
+            ring.close()
+
+    def test_worker_reads_frames_from_the_ring(self):
+        import numpy as np
+        from framering import FrameRing
+        from worker import WorkerModel
+
+        ring = FrameRing(slots=2, max_width=640, max_height=480)
+        worker = WorkerModel(EchoBackend, ring=ring)
+        try:
+            with ring.decode(encode_test_jpeg()) as frame:
+                results = worker([frame[0:40, 0:30], np.zeros((4, 6, 3), np.uint8)])
+            assert [r.xyxy.tolist() for r in results] == [[[0, 0, 30, 40]], [[0, 0, 6, 4]]]
+        finally:
+            worker.close()
+            ring.close()
+
+
+class TestMotionGate:
+    """Test that unchanged frames skip the model."""
+
+    def test_unchanged_frame_reuses_previous_detections(self, client, migrated_db, monkeypatch):
+        fake = FakeModel()
+        monkeypatch.setattr(app_module.model_loader, 'model', fake)
+        monkeypatch.setattr(app_module, 'motion_gate', app_module.MotionGate())
+        headers = {'X-Detection-Session': 'desk-1'}
+
+        first = client.post('/process_frame', data=encode_test_jpeg(), content_type='image/jpeg', headers=headers)
+        second = client.post('/process_frame', data=encode_test_jpeg(), content_type='image/jpeg', headers=headers)
+
+        assert first.get_json()['cached'] is False
+        assert second.get_json()['cached'] is True
+        assert len(fake.frames) == 1
+
+    def test_changed_frame_runs_model(self):
+        import numpy as np
+        from motion import MotionGate
+        gate = MotionGate(roi=True)
+        frame = np.zeros((360, 640, 3), np.uint8)
+        thumb, cached, roi = gate.check('s', frame)
+        gate.store('s', thumb, Detections.empty())
+
+        moved = frame.copy()
+        moved[20:80, 20:80] = 255
+        _, cached, roi = gate.check('s', moved)
+
+        assert cached is None
+        x1, y1, x2, y2 = roi
+        assert x1 == 0 and y1 == 0 and x2 < 640 and y2 < 360
+
+    def test_merge_roi_keeps_old_boxes_outside_region(self):
+        import numpy as np
+        from motion import merge_roi
+        previous = Detections(np.array([[0, 0, 10, 10], [100, 100, 120, 120]], np.float32),
+                              np.array([0.9, 0.8], np.float32), np.array([0, 1]))
+        crop = Detections(np.array([[5, 5, 15, 15]], np.float32), np.array([0.7], np.float32), np.array([2]))
+
+        merged = merge_roi(previous, crop, (90, 90, 200, 200))
+
+        assert merged.cls.tolist() == [0, 2]
+        assert merged.xyxy[1].tolist() == [95, 95, 105, 105]
+
+
+class TestTracker:
+    """Test that detections are confirmed across frames and keep their IDs."""
+
+    def test_confirms_after_n_of_m_and_keeps_ids(self):
+        import numpy as np
+        from tracker import Tracker
+        tracker = Tracker(confirm_hits=3, window=5, max_misses=2)
+        two_beakers = Detections(np.array([[0, 0, 10, 10], [50, 50, 60, 60]], np.float32),
+                                 np.array([0.9, 0.8], np.float32), np.array([0, 0]))
+        flicker = Detections(np.array([[200, 200, 210, 210]], np.float32), np.array([0.4], np.float32), np.array([1]))
+
+        assert tracker.update(two_beakers) == []
+        assert tracker.update(flicker) == []
+        confirmed = tracker.update(two_beakers)
+        confirmed = tracker.update(two_beakers)
+
+        assert sorted(t.id for t in confirmed) == [1, 2]
+        assert all(t.cls == 0 for t in confirmed)
+
+        # Confirmed tracks survive short gaps, then decay
+        assert len(tracker.update(Detections.empty())) == 2
+        tracker.update(Detections.empty())
+        assert tracker.update(Detections.empty()) == []
+
+
+class TestInstanceCounting:
+    """Test per-class counts used to prefill borrow quantities."""
+
+    def test_counts_skip_low_confidence_and_duplicates(self):
+        import numpy as np
+        names = {0: 'beaker', 1: 'funnel', 2: 'tripod'}
+        result = Detections(
+            np.array([[0, 0, 10, 10], [1, 1, 10, 10], [50, 50, 60, 60], [80, 80, 90, 90], [0, 0, 5, 5]], np.float32),
+            np.array([0.9, 0.8, 0.85, 0.1, 0.9], np.float32),
+            np.array([0, 0, 0, 0, 1]))
+
+        counts = app_module.count_equipment(result, names, {'Beaker': 20, 'Funnel': 8})
+
+        assert counts == {'Beaker': 2, 'Funnel': 1}
+
+    def test_parse_detected_quantities(self):
+        assert app_module.parse_detected(['Beaker:3,Funnel']) == {'Beaker': 3, 'Funnel': 1}
+        assert app_module.parse_detected(['Beaker', 'Erlenmeyer Flask:2']) == {'Beaker': 1, 'Erlenmeyer Flask': 2}
+
+    def test_borrow_form_prefills_detected_quantities(self, client, migrated_db):
+        response = client.get('/borrow_return?detected=Beaker:3')
+        assert b'value="3"' in response.data
+
+
+class TestConnectionLayer:
+    """Test the shared per-thread SQLite connection."""
+
+    def test_connection_is_reused_with_wal_pragmas(self, tmp_path, monkeypatch):
+        import db
+        monkeypatch.setattr(db, 'DB_PATH', str(tmp_path / 'labcv.db'))
+
+        conn = db.get_db()
+        assert db.get_db() is conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        db.close()
+
+
+class TestInventoryCache:
+    """Test the in-memory inventory cache."""
+
+    def test_cache_reloads_only_after_a_change(self, migrated_db):
+        from inventory_cache import InventoryCache
+
+        migrated_db.execute("INSERT INTO inventory (name, total_quantity, quantity) VALUES ('Beaker', 5, 5)")
+        migrated_db.commit()
+
+        cache = InventoryCache(recheck=60)
+        version = cache.snapshot()[0]
+        assert cache.by_name() == {'Beaker': 5}
+
+        # Within the recheck window nothing is read, even if the table changed
+        migrated_db.execute("UPDATE inventory SET quantity = 4")
+        migrated_db.commit()
+        assert cache.snapshot()[0] == version and cache.by_name() == {'Beaker': 5}
+
+        cache.invalidate()
+        assert cache.by_name() == {'Beaker': 4}
+
+        # Commits from other connections are picked up through PRAGMA data_version
+        cache.recheck = 0
+        version = cache.snapshot()[0]
+        assert cache.snapshot()[0] == version
+        migrated_db.execute("UPDATE inventory SET quantity = 3")
+        migrated_db.commit()
+        assert cache.by_name() == {'Beaker': 3}
+        assert cache.snapshot()[0] > version
+
+    def test_borrow_invalidates_cache(self, client, migrated_db):
+        migrated_db.execute("INSERT INTO students (student_id, name) VALUES ('C001', 'Cache')")
+        migrated_db.execute("INSERT INTO inventory (name, total_quantity, quantity) VALUES ('Funnel', 3, 3)")
+        migrated_db.commit()
+        app_module.inventory_cache.invalidate()
+        assert app_module.get_inventory_dict() == {'Funnel': 3}
+
+        client.post('/borrow_return', data={'student_id': 'C001', 'action': 'borrow',
+                                            'equipment_names': ['Funnel'], 'quantities': ['2']})
+        assert app_module.get_inventory_dict() == {'Funnel': 1}
+
+
+class TestBulkImportExport:
+    """Test bulk import and streaming export."""
+
+    def test_import_reports_bad_rows_and_keeps_good_ones(self, client, migrated_db):
+        import io
+
+        data = ("student_id,name,course,year_level,student_type\n"
+                "I001,Ana,BSCS,2,college\n"
+                "I002,Ben,,13,ibed\n"
+                "I003,Cy,,,\n")
+        response = client.post('/admin_import', content_type='multipart/form-data',
+                               data={'kind': 'students', 'file': (io.BytesIO(data.encode()), 'students.csv')})
+        assert b'2 imported' in response.data
+        assert b'IBED student grade level must be between 1 and 12.' in response.data
+        ids = [row[0] for row in migrated_db.execute("SELECT student_id FROM students ORDER BY student_id")]
+        assert ids == ['I001', 'I003']
+
+    def test_jsonl_import_and_export_round_trip(self, client, migrated_db):
+        import io
+        import json
+        import bulk
+
+        lines = ['{"name": "Pipette", "total_quantity": 4}', '{"name": "Burette", "total_quantity": 2}', '[1]']
+        result = bulk.import_rows('inventory', bulk.read_rows(io.StringIO('\n'.join(lines)), 'jsonl'), chunk_size=1)
+        assert (result.imported, result.errors) == (2, [(3, "Each line must be a JSON object.")])
+
+        response = client.get('/admin_export/inventory?format=jsonl')
+        assert response.is_streamed
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert rows == [{'name': 'Burette', 'total_quantity': 2, 'quantity': 2},
+                        {'name': 'Pipette', 'total_quantity': 4, 'quantity': 4}]
+
+        csv_text = client.get('/admin_export/inventory?format=csv').get_data(as_text=True)
+        assert csv_text.splitlines()[0] == 'name,total_quantity,quantity'
+
+
+class TestStudentSearch:
+    """Test the full-text student index and autocomplete."""
+
+    def test_index_follows_register_and_edit(self, client, migrated_db):
+        client.post('/register', data={'student_id': 'F001', 'name': 'Maria Santos', 'course': 'BS Chemistry',
+                                       'year_level': '2', 'student_type': 'college'})
+        suggestions = client.get('/student_suggestions?q=mar san').get_json()['students']
+        assert [s['student_id'] for s in suggestions] == ['F001']
+
+        client.post('/edit_student/F001', data={'student_id': 'F002', 'name': 'Maria Reyes', 'course': '',
+                                                'year_level': '2', 'student_type': 'college'})
+        assert client.get('/student_suggestions?q=santos').get_json()['students'] == []
+        assert client.get('/student_suggestions?q=F00').get_json()['students'][0]['name'] == 'Maria Reyes'
+
+    def test_records_name_search_uses_index(self, client, migrated_db):
+        import holdings
+
+        c = migrated_db.cursor()
+        c.executemany("INSERT INTO students (student_id, name) VALUES (?, ?)",
+                      [('F010', 'Jose Rizal'), ('F011', 'Josefa Llanes')])
+        holdings.log_actions(c, 'F010', 'borrow', [('Beaker', 1)])
+        holdings.log_actions(c, 'F011', 'borrow', [('Funnel', 1)])
+        migrated_db.commit()
+
+        body = client.post('/records', data={'search_type': 'name', 'search_query': 'rizal'}).get_data(as_text=True)
+        assert 'Beaker' in body and 'Funnel' not in body
+        body = client.post('/records', data={'search_type': 'name', 'search_query': 'jos'}).get_data(as_text=True)
+        assert 'Beaker' in body and 'Funnel' in body
+
+    def test_index_survives_vacuum_and_rebuild(self, migrated_db):
+        import search
+
+        c = migrated_db.cursor()
+        c.executemany("INSERT INTO students (student_id, name) VALUES (?, ?)",
+                      [('V001', 'Andres Bonifacio'), ('V002', 'Emilio Aguinaldo'), ('V003', 'Gabriela Silang')])
+        c.execute("DELETE FROM students WHERE student_id = 'V001'")
+        migrated_db.commit()
+        # VACUUM may renumber the implicit rowids of a table with a TEXT primary key
+        migrated_db.execute("VACUUM")
+
+        assert [row[0] for row in search.suggest(c, 'silang')] == ['V003']
+        assert [row[0] for row in search.suggest(c, 'bonifacio')] == []
+        c.execute("UPDATE students SET student_id = 'V004' WHERE student_id = 'V002'")
+        migrated_db.commit()
+        assert [row[0] for row in search.suggest(c, 'emilio')] == ['V004']
+
+        c.execute("DELETE FROM students_fts")
+        migrated_db.commit()
+        assert search.rebuild_index() == 2
+        assert [row[0] for row in search.suggest(c, 'emilio')] == ['V004']
+
+
+class TestMigrations:
+    """Test the versioned schema migrations."""
+
+    def test_migrate_is_versioned_and_idempotent(self, migrated_db):
+        from migrations import MIGRATIONS, migrate, current_version
+
+        assert migrate() == []
+        assert current_version() == MIGRATIONS[-1][0]
+        ran = [row[0] for row in migrated_db.execute("SELECT name FROM schema_migrations ORDER BY version")]
+        assert ran == [name for _, name, _ in MIGRATIONS]
+
+    def test_pending_lookup_uses_index(self, migrated_db):
+        plan = migrated_db.execute("""
+            EXPLAIN QUERY PLAN
+            SELECT equipment_name, SUM(quantity) FROM equipment_log WHERE student_id=? GROUP BY equipment_name
+        """, ('TEST001',)).fetchall()
+        assert any('idx_equipment_log_student_equipment' in row[-1] for row in plan)
+
+
+class TestHoldings:
+    """Test the materialized holdings table."""
+
+    def test_borrow_and_return_update_holdings(self, client, migrated_db):
+        import holdings
+
+        c = migrated_db.cursor()
+        c.execute("INSERT INTO students (student_id, name) VALUES ('H001', 'Holder')")
+        c.execute("INSERT INTO inventory (name, total_quantity, quantity) VALUES ('Beaker', 10, 10)")
+        migrated_db.commit()
+
+        client.post('/borrow_return', data={'student_id': 'H001', 'action': 'borrow',
+                                            'equipment_names': ['Beaker'], 'quantities': ['3']})
+        assert app_module.get_pending_equipment('H001') == [('Beaker', 3)]
+
+        # Returning more than is held is refused
+        client.post('/borrow_return', data={'student_id': 'H001', 'action': 'return',
+                                            'equipment_names': ['Beaker'], 'quantities': ['4']})
+        assert holdings.held_quantities(c, 'H001', ['Beaker', 'Funnel']) == {'Beaker': 3}
+
+        client.post('/borrow_return', data={'student_id': 'H001', 'action': 'return',
+                                            'equipment_names': ['Beaker'], 'quantities': ['3']})
+        assert app_module.get_pending_equipment('H001') == []
+        assert holdings.verify() == []
+
+    def test_verify_reports_drift_and_rebuild_fixes_it(self, migrated_db):
+        import holdings
+
+        c = migrated_db.cursor()
+        holdings.log_actions(c, 'H002', 'borrow', [('Funnel', 2)])
+        c.execute("UPDATE holdings SET qty = 5")
+        c.execute("INSERT INTO equipment_log (student_id, equipment_name, action, quantity) VALUES ('H002', 'Tripod', 'borrow', 1)")
+        migrated_db.commit()
+
+        assert holdings.verify() == [('H002', 'Funnel', 5, 2), ('H002', 'Tripod', 0, 1)]
+        assert holdings.rebuild() == 2
+        assert holdings.verify() == []
+
+    def test_multi_item_borrow_is_all_or_nothing(self, client, migrated_db):
+        c = migrated_db.cursor()
+        c.execute("INSERT INTO students (student_id, name) VALUES ('H003', 'Holder')")
+        c.executemany("INSERT INTO inventory (name, total_quantity, quantity) VALUES (?, ?, ?)",
+                      [('Beaker', 10, 10), ('Funnel', 2, 2)])
+        migrated_db.commit()
+
+        # Funnel is listed twice; together that is more than the stock
+        client.post('/borrow_return', data={'student_id': 'H003', 'action': 'borrow',
+                                            'equipment_names': ['Beaker', 'Funnel', 'Funnel'],
+                                            'quantities': ['4', '1', '2']})
+        assert dict(c.execute("SELECT name, quantity FROM inventory").fetchall()) == {'Beaker': 10, 'Funnel': 2}
+        assert c.execute("SELECT COUNT(*) FROM equipment_log").fetchone()[0] == 0
+
+        client.post('/borrow_return', data={'student_id': 'H003', 'action': 'borrow',
+                                            'equipment_names': ['Beaker', 'Funnel', 'Funnel'],
+                                            'quantities': ['4', '1', '1']})
+        assert dict(c.execute("SELECT name, quantity FROM inventory").fetchall()) == {'Beaker': 6, 'Funnel': 0}
+        assert app_module.get_pending_equipment('H003') == [('Beaker', 4), ('Funnel', 2)]
+        assert c.execute("SELECT COUNT(*) FROM equipment_log").fetchone()[0] == 3
+
+    def test_multi_item_borrow_is_one_transaction(self, client, migrated_db):
+        c = migrated_db.cursor()
+        c.execute("INSERT INTO students (student_id, name) VALUES ('H004', 'Holder')")
+        c.executemany("INSERT INTO inventory (name, total_quantity, quantity) VALUES (?, ?, ?)",
+                      [('Beaker', 10, 10), ('Funnel', 5, 5)])
+        migrated_db.commit()
+
+        response = client.post('/borrow_return', data={'student_id': 'H004', 'action': 'borrow',
+                                                       'equipment_names': ['Beaker', 'Funnel'],
+                                                       'quantities': ['2', '3']})
+        transaction_id = c.execute("SELECT id FROM transactions WHERE student_id='H004'").fetchone()[0]
+        assert response.location.endswith(f'/transaction_summary/{transaction_id}')
+        rows = c.execute("SELECT DISTINCT transaction_id, timestamp FROM equipment_log").fetchall()
+        assert len(rows) == 1 and rows[0][0] == transaction_id
+
+        page = client.get(response.location).get_data(as_text=True)
+        assert 'Beaker' in page and 'Funnel' in page and '<span>5</span>' in page
+        local_time = c.execute("SELECT datetime(timestamp, 'localtime') FROM transactions").fetchone()[0]
+        assert f'Transaction recorded at: {local_time}' in page
+
+
+class TestPendingEquipmentPage:
+    """Test the paginated all-students pending view."""
+
+    def test_pages_sorted_by_total_pending(self, client, migrated_db, monkeypatch):
+        import holdings
+
+        c = migrated_db.cursor()
+        for i, qty in enumerate([2, 5, 1]):
+            c.execute("INSERT INTO students (student_id, name) VALUES (?, ?)", (f"P00{i}", f"Student {i}"))
+            holdings.log_actions(c, f"P00{i}", 'borrow', [('Beaker', qty)])
+        holdings.log_actions(c, 'P000', 'borrow', [('Funnel', 4)])
+        migrated_db.commit()
+
+        students, total = app_module.get_pending_page(sort='total_desc', per_page=2)
+        assert total == 3
+        assert [s['student_id'] for s in students] == ['P000', 'P001']
+        assert students[0]['pending_items'] == [('Beaker', 2), ('Funnel', 4)]
+        assert students[0]['total_pending'] == 6
+
+        monkeypatch.setattr(app_module, 'PENDING_PAGE_SIZE', 2)
+        response = client.get('/pending_equipment?sort=total_desc&page=2')
+        assert response.status_code == 200
+        assert b'<h2>P002</h2>' in response.data and b'<h2>P000</h2>' not in response.data
+        assert b'data-student-autocomplete' in response.data
+
+        past_end = client.get('/pending_equipment?sort=total_desc&page=5')
+        assert past_end.status_code == 302 and past_end.headers['Location'].endswith('page=2')
+
+    def test_search_by_name_resolves_to_student(self, client, migrated_db):
+        import holdings
+
+        c = migrated_db.cursor()
+        c.executemany("INSERT INTO students (student_id, name) VALUES (?, ?)",
+                      [('N001', 'Apolinario Mabini'), ('N002', 'Marcelo del Pilar'), ('N003', 'Marcela Agoncillo')])
+        holdings.log_actions(c, 'N001', 'borrow', [('Beaker', 2)])
+        migrated_db.commit()
+
+        body = client.post('/pending_equipment', data={'student_id': 'mabini'}).get_data(as_text=True)
+        assert '<h2>N001</h2>' in body and 'value="N001"' in body
+        for text, message in [('marc', 'More than one student matches'), ('rizal', 'Student not found.')]:
+            body = client.post('/pending_equipment', data={'student_id': text}).get_data(as_text=True)
+            assert '<h2>N00' not in body
+            with client.session_transaction() as session:
+                assert message in session.pop('_flashes')[0][1]
+
+
+class TestLogPaging:
+    """Test keyset pagination of the log pages."""
+
+    def test_pages_follow_cursor_without_gaps(self, client, migrated_db, monkeypatch):
+        import re
+        import paging
+
+        monkeypatch.setattr(paging, 'LOG_PAGE_SIZE', 3)
+        c = migrated_db.cursor()
+        for i in range(7):
+            # Several entries share a timestamp, so the id must break ties
+            c.execute("INSERT INTO equipment_log (student_id, equipment_name, action, quantity, timestamp) VALUES (?, ?, 'borrow', 1, ?)",
+                      ('K001', f"Item{i}", f"2024-01-0{1 + i // 3} 10:00:00"))
+        migrated_db.commit()
+
+        for url in ['/history', '/admin_logs?sort=action', '/records?search_query=K001']:
+            pages = []
+            while url:
+                body = client.get(url).get_data(as_text=True)
+                pages.append(re.findall(r'<td>(Item\d)</td>', body))
+                link = re.search(r'href="([^"]*after=[^"]*)"', body)
+                url = link.group(1).replace('&amp;', '&') if link else None
+            assert [len(p) for p in pages] == [3, 3, 1]
+            assert sorted(sum(pages, [])) == [f"Item{i}" for i in range(7)]
+
+    def test_admin_log_count_is_capped(self, client, migrated_db, monkeypatch):
+        migrated_db.executemany("INSERT INTO equipment_log (student_id, equipment_name, action, quantity) VALUES ('K001', ?, 'borrow', 1)",
+                                [(f"Item{i}",) for i in range(7)])
+        migrated_db.commit()
+
+        assert '7 Records' in client.get('/admin_logs').get_data(as_text=True)
+        monkeypatch.setattr(app_module, 'ADMIN_LOG_COUNT_CAP', 5)
+        assert '5+ Records' in client.get('/admin_logs').get_data(as_text=True)
+        assert '>1 Records' in client.get('/admin_logs?equipment=Item1').get_data(as_text=True)
+
+    def test_rows_grouped_by_day(self, migrated_db):
+        from paging import LogPage
+
+        c = migrated_db.cursor()
+        for timestamp in ['2024-01-15 09:00:00', '2024-01-15 08:00:00', '2024-01-14 17:00:00']:
+            c.execute("INSERT INTO equipment_log (student_id, equipment_name, action, timestamp) VALUES ('K002', 'Beaker', 'borrow', ?)", (timestamp,))
+        page = LogPage(c, "SELECT el.timestamp, el.id FROM equipment_log el", [], [],
+                       order=[('el.timestamp', 'DESC'), ('el.id', 'DESC')], key_columns=[0, 1], timestamp_column=0)
+        groups = [(date, len(list(rows))) for date, rows in page.groups()]
+        assert groups == [('Monday, January 15, 2024', 2), ('Sunday, January 14, 2024', 1)]
+        assert page.next_cursor is None
+
+    def test_cursor_condition_uses_index_search(self, migrated_db):
+        from paging import after_condition
+
+        def plan(order, values):
+            condition, params = after_condition(order, values)
+            rows = migrated_db.execute(f"EXPLAIN QUERY PLAN SELECT el.id FROM equipment_log el WHERE {condition} "
+                                       f"ORDER BY {', '.join(f'{e} {d}' for e, d in order)} LIMIT 101", params).fetchall()
+            return ' '.join(row[3] for row in rows)
+
+        same = plan([('el.timestamp', 'DESC'), ('el.id', 'DESC')], ['2024-01-02 10:00:00', 5])
+        assert 'SEARCH el' in same and 'idx_equipment_log_timestamp (timestamp<?)' in same and 'SCAN' not in same
+        mixed = plan([('el.action', 'ASC'), ('el.timestamp', 'DESC'), ('el.id', 'DESC')], ['borrow', '2024-01-02 10:00:00', 5])
+        assert 'SEARCH el' in mixed and 'SCAN' not in mixed
+
+
+class TestQueryProfiler:
+    """Test the opt-in SQL profiler and slow-query log."""
+
+    def test_profiled_connection_records_statements_and_plans(self, tmp_path, monkeypatch):
+        import db
+        import sqlprofile
+        profiler = sqlprofile.Profiler(slow_ms=0, log_path=str(tmp_path / 'logs' / 'slow.log'))
+        monkeypatch.setattr(sqlprofile, 'ENABLED', True)
+        monkeypatch.setattr(sqlprofile, 'profiler', profiler)
+
+        conn = db.connect(str(tmp_path / 'profiled.db'))
+        conn.execute("CREATE TABLE log (id INTEGER PRIMARY KEY, student_id TEXT)")
+        conn.executemany("INSERT INTO log (student_id) VALUES (?)", [(f'S{i % 10}',) for i in range(50)])
+        assert len(conn.execute("SELECT id FROM log WHERE student_id = ?", ('S1',)).fetchall()) == 5
+        for _ in conn.execute("SELECT   id FROM log\n  WHERE id < ?", (3,)):
+            pass
+        sqlprofile.flush()
+
+        stats = {s.sql: s for s in profiler.top()}
+        assert stats["INSERT INTO log (student_id) VALUES (?)"].rows == 50
+        select = stats["SELECT id FROM log WHERE student_id = ?"]
+        assert select.calls == 1 and select.rows == 5 and select.slow == 1
+        assert any('SCAN log' in line for line in select.plan)
+        assert stats["SELECT id FROM log WHERE id < ?"].rows == 2
+        assert profiler.take_thread_seconds() > 0
+        conn.close()
+
+        log = (tmp_path / 'logs' / 'slow.log').read_text()
+        assert "SELECT id FROM log WHERE student_id = ?" in log and "params: ('S1',)" in log
+
+    def test_streamed_page_rows_are_profiled(self, client, migrated_db, tmp_path, monkeypatch):
+        import db
+        import sqlprofile
+        migrated_db.executemany("INSERT INTO equipment_log (student_id, equipment_name, action, quantity) VALUES (?, 'Beaker', 'borrow', 1)",
+                                [('P001',), ('P002',), ('P003',)])
+        migrated_db.commit()
+        profiler = sqlprofile.Profiler(log_path=str(tmp_path / 'slow.log'))
+        monkeypatch.setattr(sqlprofile, 'ENABLED', True)
+        monkeypatch.setattr(sqlprofile, 'profiler', profiler)
+        db.close()  # reopen as a profiling connection
+
+        response = client.get('/history', buffered=False)
+        response.get_data()
+        response.close()
+
+        # The rows are fetched while the page streams, after after_request
+        page_query = next(s for s in profiler.top() if 'FROM equipment_log el' in s.sql)
+        assert page_query.rows == 3
+        db.close()
+
+    def test_admin_queries_page(self, client, migrated_db, monkeypatch):
+        import sqlprofile
+        profiler = sqlprofile.Profiler()
+        monkeypatch.setattr(sqlprofile, 'profiler', profiler)
+        profiler.record(None, "SELECT * FROM students", (), 0.002, 3)
+
+        monkeypatch.setattr(sqlprofile, 'ENABLED', False)
+        assert b'LABCV_SQL_PROFILE=1' in client.get('/admin_queries').data
+
+        monkeypatch.setattr(sqlprofile, 'ENABLED', True)
+        response = client.get('/admin_queries?sort=max')
+        assert b'SELECT * FROM students' in response.data
+
+        client.post('/admin_queries')
+        assert profiler.top() == []
+
+
+class TestBackendPostprocessing:
+    """Test the NumPy post-processing shared by the ONNX/OpenVINO backends."""
+
+    def test_postprocess_maps_boxes_back_and_suppresses_overlaps(self):
+        import numpy as np
+        from backends import postprocess, preprocess
+
+        frame = np.zeros((320, 640, 3), np.uint8)
+        batch, metas = preprocess([frame], 640)
+        assert batch.shape == (1, 3, 640, 640)
+
+        # Two overlapping class-0 boxes and one class-1 box, in letterboxed coordinates
+        pred = np.zeros((1, 6, 3), np.float32)
+        pred[0, :4, 0] = [100, 260, 40, 40]
+        pred[0, :4, 1] = [102, 262, 40, 40]
+        pred[0, :4, 2] = [300, 320, 20, 20]
+        pred[0, 4, :2] = [0.9, 0.8]
+        pred[0, 5, 2] = 0.6
+
+        det = postprocess(pred, metas)[0]
+
+        assert det.cls.tolist() == [0, 1]
+        assert np.allclose(det.xyxy[0], [80, 80, 120, 120])
+        assert np.allclose(det.conf, [0.9, 0.6])
+
+    def test_onnx_backend_times_each_stage(self):
+        import numpy as np
+        from backends import OnnxBackend, STAGES
+
+        class FakeSession:
+            def run(self, outputs, feeds):
+                return [np.zeros((len(feeds['images']), 6, 3), np.float32)]
+
+        backend = OnnxBackend.__new__(OnnxBackend)
+        backend.imgsz, backend.conf_threshold, backend.input_name = 640, 0.25, 'images'
+        backend.session = FakeSession()
+
+        results = backend([np.zeros((320, 640, 3), np.uint8)] * 2)
+        assert list(results[0].stages) == list(STAGES) and results[1].stages is results[0].stages
+        assert all(seconds >= 0 for seconds in results[0].stages.values())
+
+    def test_ultralytics_speed_becomes_batch_stages(self):
+        import numpy as np
+        from backends import UltralyticsBackend
+
+        class Array(np.ndarray):
+            def cpu(self):
+                return self
+
+            def numpy(self):
+                return np.asarray(self)
+
+        class FakeResult:
+            speed = {'preprocess': 2.0, 'inference': 10.0, 'postprocess': 1.0}  # ms per image
+            boxes = type('Boxes', (), {'xyxy': np.zeros((0, 4)).view(Array), 'conf': np.zeros(0).view(Array),
+                                       'cls': np.zeros(0).view(Array)})
+
+        backend = UltralyticsBackend.__new__(UltralyticsBackend)
+        backend.imgsz, backend.conf_threshold = None, 0.25
+        backend.model = lambda frames, **kwargs: [FakeResult() for _ in frames]
+
+        results = backend([None, None])
+        assert results[0].stages == {'preprocess': 0.004, 'inference': 0.02, 'postprocess': 0.002}
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
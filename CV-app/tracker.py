@@ -0,0 +1,126 @@
+"""
+Temporal tracking of detections across frames of a detection session.
+
+Single frames flicker: an item can be missed for a frame, and a one-off false
+positive can appear for a frame. The tracker associates each frame's boxes
+with existing tracks by IoU (same class only), confirms a track once it was
+seen in N of the last M frames, and drops it after it has been missing for a
+while. Confirmed tracks keep a stable ID, so several beakers on the tray are
+counted as several beakers.
+"""
+
+import itertools
+import os
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+
+TRACK_IOU = float(os.environ.get('LABCV_TRACK_IOU', '0.3'))
+TRACK_CONFIRM_HITS = int(os.environ.get('LABCV_TRACK_CONFIRM', '3'))   # N ...
+TRACK_WINDOW = int(os.environ.get('LABCV_TRACK_WINDOW', '5'))          # ... of the last M frames
+TRACK_MAX_MISSES = int(os.environ.get('LABCV_TRACK_MAX_MISSES', '10'))
+TENTATIVE_MAX_MISSES = 2
+MAX_SESSIONS = 64
+
+
+class Track:
+    __slots__ = ('id', 'cls', 'box', 'conf', 'history', 'misses', 'confirmed')
+
+    def __init__(self, track_id, cls, box, conf, window):
+        self.id = track_id
+        self.cls = cls
+        self.box = box
+        self.conf = conf
+        self.history = deque([1], maxlen=window)
+        self.misses = 0
+        self.confirmed = False
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes."""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+class Tracker:
+    """IoU tracker with N-of-M confirmation for one detection session."""
+
+    def __init__(self, iou_threshold=TRACK_IOU, confirm_hits=TRACK_CONFIRM_HITS,
+                 window=TRACK_WINDOW, max_misses=TRACK_MAX_MISSES):
+        self.iou_threshold = iou_threshold
+        self.confirm_hits = confirm_hits
+        self.window = window
+        self.max_misses = max_misses
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, detections):
+        """Feed one frame's Detections; returns the confirmed tracks."""
+        matched_tracks, matched_dets = set(), set()
+        if self.tracks and len(detections):
+            track_boxes = np.array([t.box for t in self.tracks], np.float32)
+            ious = iou_matrix(track_boxes, detections.xyxy)
+            # Only boxes of the same class may continue a track
+            same_class = np.array([t.cls for t in self.tracks])[:, None] == detections.cls[None, :]
+            ious = np.where(same_class, ious, 0)
+
+            # Greedy association, best overlap first
+            for ti, di in zip(*np.unravel_index(np.argsort(-ious, axis=None), ious.shape)):
+                if ious[ti, di] < self.iou_threshold:
+                    break
+                if ti in matched_tracks or di in matched_dets:
+                    continue
+                matched_tracks.add(ti)
+                matched_dets.add(di)
+                track = self.tracks[ti]
+                track.box = detections.xyxy[di].tolist()
+                track.conf = float(detections.conf[di])
+                track.history.append(1)
+                track.misses = 0
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.history.append(0)
+                track.misses += 1
+
+        for di in range(len(detections)):
+            if di not in matched_dets:
+                self.tracks.append(Track(next(self._ids), int(detections.cls[di]),
+                                         detections.xyxy[di].tolist(), float(detections.conf[di]), self.window))
+
+        for track in self.tracks:
+            if not track.confirmed and sum(track.history) >= self.confirm_hits:
+                track.confirmed = True
+        self.tracks = [
+            t for t in self.tracks
+            if t.misses <= (self.max_misses if t.confirmed else TENTATIVE_MAX_MISSES)
+        ]
+        return [t for t in self.tracks if t.confirmed]
+
+
+class TrackerRegistry:
+    """One Tracker per detection session, least recently used sessions evicted."""
+
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._trackers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, session, detections):
+        with self._lock:
+            tracker = self._trackers.get(session)
+            if tracker is None:
+                tracker = self._trackers[session] = Tracker()
+            self._trackers.move_to_end(session)
+            while len(self._trackers) > self.max_sessions:
+                self._trackers.popitem(last=False)
+            return tracker.update(detections)
+
+    def reset(self, session):
+        with self._lock:
+            self._trackers.pop(session, None)
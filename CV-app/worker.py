@@ -0,0 +1,143 @@
+"""
+Out-of-process inference.
+
+With LABCV_INFERENCE_WORKER=1 the detector is loaded in a separate process
+instead of inside the web server. WorkerModel is the web server's handle on
+it: it looks like a backend (``names``, ``name``, ``imgsz``, and calling it
+with a list of frames returns one Detections per frame), so the
+InferenceScheduler keeps batching and superseding frames exactly as before
+and only the model call crosses the process boundary.
+
+Inference then has its own interpreter and its own cores, and a slow or
+crashed model can't stall the threads serving inventory and records pages.
+If the worker dies it is started again on the next batch. The child runs
+this module as its main script, not app.py, so it never builds the Flask
+app, and it is stopped when the web server exits.
+"""
+
+import atexit
+import importlib.util
+import multiprocessing
+import sys
+import threading
+from contextlib import contextmanager
+
+from framering import RingReader
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+class WorkerModel:
+    """Runs ``factory()`` (a picklable callable returning a backend) in a child process.
+
+    The constructor blocks until the child has loaded the model, so create it
+    from ModelLoader's background thread.
+    """
+
+    def __init__(self, factory, ring=None):
+        self.factory = factory
+        # Optional framering.FrameRing: frames decoded into it reach the worker without being copied
+        self.ring = ring
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._process = None
+        self._conn = None
+        self.restarts = 0
+        self._start()
+        # Stop and join the child before the frame ring it reads is unlinked
+        atexit.register(self.close)
+
+    def _start(self):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=serve, args=(child, self.factory, self.ring and self.ring.name),
+                                        name='labcv-inference', daemon=True)
+        with _child_main(__name__):
+            process.start()
+        child.close()
+        try:
+            kind, payload = parent.recv()
+        except EOFError:
+            process.join(5)
+            raise WorkerError(f"Inference worker exited while loading (exit code {process.exitcode})")
+        if kind == 'error':
+            process.join(5)
+            raise WorkerError(payload)
+        self._process, self._conn = process, parent
+        self.names = payload['names']
+        self.name = payload['name']
+        self.imgsz = payload['imgsz']
+        self.pid = process.pid
+
+    def __call__(self, frames):
+        with self._lock:
+            if not self._process.is_alive():
+                print("Inference worker exited; restarting it.")
+                self.restarts += 1
+                self._start()
+            try:
+                self._conn.send(('predict', [self._pack(frame) for frame in frames]))
+                kind, payload = self._conn.recv()
+            except (EOFError, OSError) as e:
+                raise WorkerError(f"Inference worker stopped: {e}")
+        if kind == 'error':
+            raise WorkerError(payload)
+        return payload
+
+    def _pack(self, frame):
+        """Send frames that live in the shared ring as a descriptor, anything else as pixels."""
+        descriptor = self.ring.describe(frame) if self.ring is not None else None
+        return ('shm', descriptor) if descriptor is not None else ('array', frame)
+
+    def close(self):
+        with self._lock:
+            if self._process is not None and self._process.is_alive():
+                try:
+                    self._conn.send(('stop', None))
+                except OSError:
+                    pass
+                self._process.join(5)
+                if self._process.is_alive():
+                    self._process.terminate()
+
+
+@contextmanager
+def _child_main(name):
+    """Have spawned children run module ``name`` as their __main__ instead of ours.
+
+    A spawned child re-runs the parent's main script (app.py: Flask, routes
+    and all) before it unpickles its target. Pointing it at this module
+    instead keeps the worker's imports to worker.py and the backend factory.
+    """
+    main = sys.modules['__main__']
+    spec = getattr(main, '__spec__', None)
+    main.__spec__ = importlib.util.find_spec(name)
+    try:
+        yield
+    finally:
+        main.__spec__ = spec
+
+
+def serve(conn, factory, ring_name=None):
+    """Child process: load the model, then answer ('predict', frames) messages until told to stop."""
+    try:
+        reader = RingReader(ring_name) if ring_name else None
+        model = factory()
+    except Exception as e:
+        conn.send(('error', str(e)))
+        return
+    conn.send(('ready', {'names': model.names, 'name': model.name, 'imgsz': model.imgsz}))
+    while True:
+        try:
+            kind, payload = conn.recv()
+        except EOFError:
+            return  # the web server went away
+        if kind == 'stop':
+            return
+        try:
+            frames = [reader.frame(data) if how == 'shm' else data for how, data in payload]
+            conn.send(('result', list(model(frames))))
+            del frames  # don't keep views of slots the web server may reuse
+        except Exception as e:
+            conn.send(('error', str(e)))